@@ -0,0 +1,657 @@
+import os
+import asyncio
+import contextlib
+import logging
+
+import aiohttp
+
+from urllib.parse import urljoin
+from pathvalidate import sanitize_filename
+
+import metrics
+import http_client
+import blob_store
+import incremental
+import response_cache
+import parse_pool
+import scheduler
+
+from rate_limit import RETRY_STATUSES
+from rate_limit import get_backoff_delay
+
+from storage import CHUNK_SIZE
+from response_cache import CachedResponse
+from storage import AtomicFileWriter
+from storage import is_compressed
+from storage import get_stored_filename
+from storage import get_shard_folder
+
+from parser import parse_category_page
+from parser import parse_category_listing
+
+from services import Book
+from services import get_image_name_from_url
+from services import get_page_encoding
+
+logger = logging.getLogger(__name__)
+
+
+class RedirectToMainPage(aiohttp.ClientError):
+    """Сайт перенаправил на главную страницу (страницы нет)."""
+
+
+def check_for_redirect(response):
+    """Проверяет редирект на главную страницу.
+
+    В случаи редиректа бросает исключение.
+
+    :param response: Ответ сайта tululu.org.
+    """
+    logger.debug('Проверка редиректа на главную страницу')
+    if str(response.url) == http_client.settings.base_url:
+        raise RedirectToMainPage(str(response.url))
+
+
+def create_session(concurrency: int = 100) -> aiohttp.ClientSession:
+    """Создаёт сессию aiohttp с лимитом одновременных соединений.
+
+    Лимит на хост, keep-alive, таймауты и Accept-Encoding берутся из
+    настроек http_client.
+
+    :param concurrency: сколько соединений держим одновременно.
+
+    :return: aiohttp.ClientSession - сессия для запросов к tululu.org.
+    """
+    settings = http_client.settings
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=settings.max_per_host,
+        force_close=not settings.keep_alive
+    )
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=settings.connect_timeout,
+        sock_read=settings.read_timeout
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={'Accept-Encoding': settings.accept_encoding}
+    )
+
+
+async def request(
+        session: aiohttp.ClientSession,
+        url: str,
+        **kwargs
+) -> aiohttp.ClientResponse:
+    """GET запрос с ограничением скорости и повторами, как http_client.get.
+
+    Ошибки соединения и ответы 429/5xx повторяются до
+    http_client.settings.max_attempts раз, затем пробрасываются.
+
+    :param session: сессия aiohttp.
+    :param url: адрес запроса.
+    :param kwargs: дополнительные аргументы aiohttp.ClientSession.get.
+
+    :return: aiohttp.ClientResponse - ответ сервера (без ошибки).
+    """
+    settings = http_client.settings
+    attempt = 0
+    while True:
+        attempt += 1
+        delay = http_client.limiter.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            with metrics.timer('network'):
+                response = await session.get(url, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            metrics.add('requests', label='error')
+            if attempt >= settings.max_attempts:
+                raise
+            metrics.add('retries', label='connection')
+            delay = get_backoff_delay(
+                attempt,
+                settings.backoff_base,
+                settings.backoff_max
+            )
+            logger.warning(
+                'Ошибка соединения с %s, повтор через %.1f сек.',
+                url,
+                delay
+            )
+            await asyncio.sleep(delay)
+            continue
+
+        http_client.limiter.on_response(response.status)
+        metrics.add('requests', label=response.status)
+        retry = response.status in RETRY_STATUSES
+        if retry and attempt < settings.max_attempts:
+            metrics.add('retries', label=response.status)
+            delay = http_client.get_retry_delay(attempt, response.headers)
+            logger.warning(
+                'Сайт ответил %s на %s, повтор через %.1f сек.',
+                response.status,
+                url,
+                delay
+            )
+            response.release()
+            await asyncio.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response
+
+
+async def async_get_page(
+        session: aiohttp.ClientSession,
+        url: str
+) -> CachedResponse:
+    """Загружаем html страницу сайта, через кэш страниц если он включён.
+
+    :param session: сессия aiohttp.
+    :param url: адрес страницы.
+
+    Тело ответа отдаётся парсеру байтами, без угадывания кодировки
+    aiohttp (см. services.get_page).
+
+    :return: CachedResponse - url после редиректов и html страницы.
+    """
+    cache = response_cache.cache
+    if cache is not None:
+        cached_response = cache.get(url)
+        if cached_response is not None:
+            logger.debug('Страница %s взята из кэша', url)
+            check_for_redirect(cached_response)
+            return cached_response
+        if cache.offline:
+            raise aiohttp.ClientError('Страницы {} нет в кэше'.format(url))
+
+    async with scheduler.async_slot('page'):
+        async with await request(session, url) as response:
+            logger.debug('response status code: %s', response.status)
+            try:
+                check_for_redirect(response)
+            except RedirectToMainPage:
+                if cache is not None:
+                    cache.put(url, str(response.url), '')
+                raise
+            content = await response.read()
+            metrics.add('bytes_downloaded', len(content))
+            await scheduler.async_throttle('page', get_wire_bytes(response))
+            page = CachedResponse(
+                str(response.url),
+                content,
+                get_page_encoding(response.headers.get('Content-Type'))
+            )
+
+    if cache is not None:
+        cache.put(url, page.url, page.text)
+    return page
+
+
+async def async_get_book(session: aiohttp.ClientSession, book_id: int) -> Book:
+    """Получаем книгу (Book) по-указанному id.
+
+    :param session: сессия aiohttp.
+    :param book_id: id книги для скачивания.
+
+    :return: Book - информация по книге
+    """
+    logger.debug('Загружаем информацию с сайта о книге')
+
+    url = '{}b{}/'.format(http_client.settings.base_url, book_id)
+    logger.debug('url: %s', url)
+
+    page = await async_get_page(session, url)
+    book = await parse_pool.async_parse_book_page(page.html, page.encoding)
+
+    book['id'] = book_id
+    book['poster_link'] = urljoin(page.url, book['poster_link'])
+    book['download_link'] = urljoin(page.url, '/txt.php')
+
+    logger.debug('Завершено')
+    return Book(**book)
+
+
+async def async_download_txt(
+        session: aiohttp.ClientSession,
+        url,
+        filename,
+        params=None,
+        dest_folder='./',
+        subfolder='books/'
+) -> str:
+    """Качает текстовый файл по-указанному url и сохраняет на диск.
+
+    :param session: сессия aiohttp.
+    :param url: ссылка на скачивание.
+    :param filename: имя для сохранения.
+    :param params: дополнительные параметры запроса
+    :param dest_folder: основная папка для сохранения книги.
+    :param subfolder: подпапка для сохранения книги (будет создана если её нет)
+
+    :return: str - Строку с указанием куда сохранили файл.
+    """
+    logger.debug('Скачиваем текстовую версию книги')
+    logger.debug('url: %s', url)
+
+    folder = os.path.join(dest_folder, subfolder)
+    filename = get_stored_filename(
+        sanitize_filename('{}.txt'.format(filename))
+    )
+    folder = get_shard_folder(folder, filename)
+    logger.debug('Имя файла: %s', filename)
+
+    headers = incremental.conditional_headers(os.path.join(folder, filename))
+    async with scheduler.async_slot('txt'):
+        response = await request(session, url, params=params, headers=headers)
+        async with response:
+            logger.debug('response status code: %s', response.status)
+            check_for_redirect(response)
+            return await save_response(response, folder, filename)
+
+
+async def async_download_image(
+        session: aiohttp.ClientSession,
+        url,
+        dest_folder='',
+        subfolder='images/'
+) -> str:
+    """Качает картинку по-указанному url и сохраняет на диск.
+
+    :param session: сессия aiohttp.
+    :param url: ссылка на скачивание.
+    :param dest_folder: основная папка для сохранения постера.
+    :param subfolder: подпапка для сохранения постеров (будет создана если её нет)
+
+    :return: str - Строку с указанием куда сохранили файл.
+    """
+    logger.debug('Скачиваем обложку книги')
+    logger.debug('url: %s', url)
+
+    folder = os.path.join(dest_folder, subfolder)
+    filename = get_image_name_from_url(url)
+    folder = get_shard_folder(folder, filename)
+    logger.debug('Имя файла: %s', filename)
+
+    poster_store = blob_store.store
+    if poster_store is not None:
+        digest = poster_store.lookup(url)
+        if digest is not None:
+            logger.debug('Обложка уже есть в хранилище')
+            return poster_store.materialize(digest, folder, filename)
+
+    headers = incremental.conditional_headers(os.path.join(folder, filename))
+    async with scheduler.async_slot('poster'):
+        response = await request(session, url, headers=headers)
+        async with response:
+            logger.debug('response status code: %s', response.status)
+            check_for_redirect(response)
+            if poster_store is None:
+                return await save_response(
+                    response,
+                    folder,
+                    filename,
+                    'poster'
+                )
+
+            path_to_save = os.path.join(folder, filename)
+            if response.status == 304:
+                logger.debug('Файл %s не изменился', path_to_save)
+                incremental.mark_not_modified(path_to_save)
+                digest = poster_store.add_file(path_to_save, url)
+                return poster_store.materialize(digest, folder, filename)
+
+            with poster_store.open_writer() as writer:
+                async for chunk in iter_response_chunks(response, 'poster'):
+                    writer.write(chunk)
+                if not writer.size:
+                    raise aiohttp.ClientPayloadError(
+                        'Пустой ответ на {}'.format(url)
+                    )
+                digest = poster_store.add(writer, url)
+            return poster_store.materialize(digest, folder, filename)
+
+
+def get_wire_bytes(response: aiohttp.ClientResponse) -> int:
+    """Сколько байт тела ответа пришло из сети (до распаковки gzip).
+
+    В старых aiohttp нет total_raw_bytes, тогда считаем распакованные.
+    """
+    content = response.content
+    return getattr(content, 'total_raw_bytes', content.total_bytes)
+
+
+async def iter_response_chunks(response: aiohttp.ClientResponse, kind: str):
+    """То же что services.iter_response_chunks, для aiohttp."""
+    wire_bytes = get_wire_bytes(response)
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        metrics.add('bytes_downloaded', len(chunk))
+        await scheduler.async_throttle(
+            kind,
+            get_wire_bytes(response) - wire_bytes
+        )
+        wire_bytes = get_wire_bytes(response)
+        yield chunk
+
+
+async def save_response(
+        response: aiohttp.ClientResponse,
+        folder: str,
+        filename: str,
+        kind: str = 'txt'
+) -> str:
+    """Сохраняет скаченный файл, если он поменялся с прошлого скачивания.
+
+    Тело ответа пишется на диск частями по CHUNK_SIZE во временный файл,
+    который затем атомарно переименовывается.
+    Если имя файла оканчивается на .gz, содержимое сжимается в gzip.
+
+    :param response: ответ сайта с файлом.
+    :param folder: папка для сохранения.
+    :param filename: имя файла.
+    :param kind: класс запроса для планировщика скачиваний.
+
+    :return: str - путь до файла
+    """
+    path_to_save = os.path.join(folder, filename)
+    if response.status == 304:
+        logger.debug('Файл %s не изменился', path_to_save)
+        incremental.mark_not_modified(path_to_save)
+        return path_to_save
+
+    compress = is_compressed(filename)
+    with AtomicFileWriter(folder, filename, compress) as writer:
+        async for chunk in iter_response_chunks(response, kind):
+            writer.write(chunk)
+
+        if incremental.is_unchanged(path_to_save, writer.size, writer.sha256):
+            logger.debug('Файл %s не изменился', path_to_save)
+            incremental.refresh(path_to_save, response.headers)
+            return path_to_save
+
+        writer.commit()
+        incremental.remember(
+            path_to_save,
+            response.headers,
+            writer.size,
+            writer.sha256,
+            writer.stored_size
+        )
+    return path_to_save
+
+
+async def async_fetch_book(
+        session: aiohttp.ClientSession,
+        book_id: int,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False
+) -> Book:
+    """Качает и сохраняет книгу и обложку с сайта tululu.org.
+
+    :param session: сессия aiohttp.
+    :param book_id: ID книги для скачивания.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+
+    :return: Book - информация по скаченной книге.
+    """
+    logger.info('фетчим книгу с id - %s', book_id)
+    book = await async_get_book(session, book_id)
+    await async_download_book_files(
+        session,
+        book,
+        dest_folder,
+        skip_imgs,
+        skip_txt
+    )
+    logger.debug('Завершено')
+    return book
+
+
+async def async_download_book_files(
+        session: aiohttp.ClientSession,
+        book: Book,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False
+) -> Book:
+    """Качает обложку и текст уже полученной книги.
+
+    :param session: сессия aiohttp.
+    :param book: книга (Book) полученная с сайта.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+
+    :return: Book - та же книга с путями до файлов.
+    """
+    if not skip_imgs:
+        book.poster_saved_path = await async_download_image(
+            session,
+            book.poster_link,
+            dest_folder
+        )
+
+    if not skip_txt:
+        book.book_saved_path = await async_download_txt(
+            session,
+            book.download_link,
+            '{}_{}'.format(book.id, book.title),
+            {'id': book.id},
+            dest_folder
+        )
+    return book
+
+
+async def async_fetch_books(
+        book_ids,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False,
+        concurrency: int = 100,
+        on_book=None
+) -> list[Book]:
+    """Качает книги с сайта tululu.org в одном потоке через asyncio.
+
+    Порядок результата совпадает с порядком book_ids, книги которые
+    не удалось скачать пропускаются. Если включён планировщик
+    скачиваний, concurrency ограничивает только страницы книг, а
+    обложки и тексты ждут мест в своих классах планировщика.
+
+    :param book_ids: ID книг для скачивания.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+    :param concurrency: сколько книг качаем одновременно.
+    :param on_book: функция, которую вызываем с каждой скаченной книгой
+        в порядке book_ids, как только скачаны все книги перед ней.
+
+    :return: list - список скаченных книг (Book).
+    """
+    logger.info('Качаем книги, одновременно до %s', concurrency)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    files_semaphore = semaphore
+    if scheduler.scheduler is not None:
+        files_semaphore = contextlib.nullcontext()
+    finished = {}
+    next_index = 0
+
+    def emit_finished():
+        nonlocal next_index
+        while next_index in finished:
+            book = finished.pop(next_index)
+            next_index += 1
+            if book is not None and on_book is not None:
+                on_book(book)
+
+    async def fetch(session, index, book_id):
+        book = None
+        try:
+            async with semaphore:
+                logger.info('фетчим книгу с id - %s', book_id)
+                fetched_book = await async_get_book(session, book_id)
+            async with files_semaphore:
+                book = await async_download_book_files(
+                    session,
+                    fetched_book,
+                    dest_folder,
+                    skip_imgs,
+                    skip_txt
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            metrics.add('book_errors')
+            logger.error(
+                'Не удалось скачать книгу или обложку. id - %s',
+                book_id
+            )
+        else:
+            metrics.add('books')
+        finally:
+            finished[index] = book
+            emit_finished()
+        return book
+
+    async with create_session(concurrency) as session:
+        results = await asyncio.gather(
+            *(
+                fetch(session, index, book_id)
+                for index, book_id in enumerate(book_ids)
+            ),
+            return_exceptions=True
+        )
+
+    books = []
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+        if result is not None:
+            books.append(result)
+    logger.info('Скачано книг: %s', len(books))
+    return books
+
+
+async def async_get_book_ids_from_category_page(
+        session: aiohttp.ClientSession,
+        category_id: int,
+        category_page: int
+) -> list[int]:
+    """Получаем информацию о id книгах на конкретной страницы категории.
+
+    :param session: сессия aiohttp.
+    :param category_id: id книжной категории.
+    :param category_page: страница категории.
+
+    :return: list - список найденных id книг на странице категории.
+    """
+    url = '{}l{}/{}/'.format(
+        http_client.settings.base_url,
+        category_id,
+        category_page
+    )
+    logger.debug('url: %s', url)
+
+    page = await async_get_page(session, url)
+    with metrics.timer('parse'):
+        return parse_category_page(page.html, page.encoding)
+
+
+async def async_get_book_ids_in_range_pages_in_category(
+        category_id: int,
+        start_page: int = 1,
+        end_page: int = 2,
+        concurrency: int = 100,
+        fetched_pages: dict | None = None
+) -> list[int]:
+    """Получаем id книг выбранной категории и страниц с сайта tululu.org.
+
+    Страницы категории запрашиваются одновременно, порядок id сохраняется.
+
+    :param category_id: id книжной категории.
+    :param start_page: номер страницы категории откуда начинаем парсить.
+    :param end_page: номер страницы категории на которой заканчиваем парсить.
+    :param concurrency: сколько страниц запрашиваем одновременно.
+    :param fetched_pages: уже скаченные страницы категории
+        {номер страницы: список id книг}, повторно не запрашиваются.
+
+    :return: list - список id найденных книг в выбранном диапазоне
+    """
+    logger.info('Получаем айденты книг в категории %s', category_id)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    category_pages = range(start_page, end_page)
+    fetched_pages = fetched_pages or {}
+
+    async def fetch(session, category_page):
+        if category_page in fetched_pages:
+            return fetched_pages[category_page]
+        async with semaphore:
+            return await async_get_book_ids_from_category_page(
+                session,
+                category_id,
+                category_page
+            )
+
+    async with create_session(concurrency) as session:
+        results = await asyncio.gather(
+            *(fetch(session, page) for page in category_pages),
+            return_exceptions=True
+        )
+
+    book_ids = []
+    for category_page, result in zip(category_pages, results):
+        if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError)):
+            logger.error(
+                'Ошибка при парсинге страницы %s категории %s',
+                category_page,
+                category_id
+            )
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        book_ids.extend(result)
+
+    logger.debug('book_ids: %s', book_ids)
+    logger.info('Айденты книг получены')
+    return book_ids
+
+
+async def async_get_category_end_page(category_id: int) -> int:
+    """Получаем информацию о количестве страниц в выбранной категории.
+
+    :param category_id: id книжной категории.
+
+    :return: int - сколько всего страниц в выбранной категории.
+    """
+    category_end_page, _ = await async_get_category_page(category_id)
+    return category_end_page
+
+
+async def async_get_category_page(
+        category_id: int,
+        category_page: int = 1
+) -> tuple[int, list[int]]:
+    """Получаем количество страниц категории и id книг на её странице.
+
+    Страница скачивается и парсится один раз.
+
+    :param category_id: id книжной категории.
+    :param category_page: страница категории.
+
+    :return: tuple(сколько всего страниц в категории, список id книг
+        на странице категории).
+    """
+    url = '{}l{}/{}/'.format(
+        http_client.settings.base_url,
+        category_id,
+        category_page
+    )
+    logger.debug('url: %s', url)
+
+    async with create_session(1) as session:
+        page = await async_get_page(session, url)
+
+    with metrics.timer('parse'):
+        return parse_category_listing(page.html, page.encoding)
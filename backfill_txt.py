@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+import requests
+
+import http_client
+import scheduler
+import storage
+
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_store import MetadataStore
+from services import configure_logging
+from services import download_txt
+from services import save_books_as_json_file
+
+logger = logging.getLogger(__name__)
+
+
+def needs_txt(book: dict) -> bool:
+    """Нет ли у книги скаченного текста (качали с --skip_txt)."""
+    path = book.get('book_saved_path')
+    return not path or not os.path.exists(storage.resolve_saved_path(path))
+
+
+def backfill_books(
+        books: list[dict],
+        dest_folder: str,
+        workers: int,
+        downloaded: dict
+):
+    """Докачивает тексты книг, у которых их нет, и прописывает пути.
+
+    :param books: список словарей с информацией о книгах.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param workers: сколько текстов качаем параллельно.
+    :param downloaded: id книги -> путь до текста, уже скаченные в этом
+        запуске (из json и базы текст качается один раз).
+    """
+    def download(book):
+        if book['id'] not in downloaded:
+            downloaded[book['id']] = download_txt(
+                book['download_link'],
+                '{}_{}'.format(book['id'], book['title']),
+                dest_folder=dest_folder
+            )
+        book['book_saved_path'] = downloaded[book['id']]
+        return book
+
+    missing = [book for book in books if needs_txt(book)]
+    logger.info('Книг без текста: %s из %s', len(missing), len(books))
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [
+            (book['id'], executor.submit(download, book))
+            for book in missing
+        ]
+        for book_id, future in futures:
+            try:
+                future.result()
+            except requests.RequestException:
+                logger.error(
+                    'Не удалось скачать текст книги. id - %s',
+                    book_id
+                )
+
+
+def backfill_json(
+        json_path: str,
+        dest_folder: str,
+        workers: int,
+        downloaded: dict
+):
+    folder, filename = os.path.split(json_path)
+    with open(json_path, mode='r', encoding='utf-8') as file:
+        books = json.load(file)
+    backfill_books(books, dest_folder, workers, downloaded)
+    save_books_as_json_file(filename, books, folder or './')
+
+
+def backfill_metadata_db(
+        metadata_db: str,
+        dest_folder: str,
+        workers: int,
+        downloaded: dict
+):
+    book_store = MetadataStore(metadata_db)
+    try:
+        books = [book for book in book_store.iter_books() if needs_txt(book)]
+        backfill_books(books, dest_folder, workers, downloaded)
+        for book in books:
+            if not needs_txt(book):
+                book_store.upsert(book)
+    finally:
+        book_store.close()
+
+
+def create_arg_parser():
+    description = 'Докачиваем тексты книг, скаченных с --skip_txt'
+    epilog = """
+    Пути до текстов прописываются в json и базе книг
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=description,
+        epilog=epilog
+    )
+    arg_parser.add_argument('--json_path', default='', metavar='', type=str,
+                            help='''json с информацией о книгах, тексты
+                            которых нужно докачать.
+                            По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--metadata_db', default='', metavar='',
+                            type=str,
+                            help='''база SQLite с информацией о книгах,
+                            тексты которых нужно докачать.
+                            По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--dest_folder', default='media/', metavar='',
+                            type=str,
+                            help='''папка, куда сохранялись книги при
+                            скачивании. Значение по умолчанию media/ '''
+                            )
+
+    arg_parser.add_argument('--workers', default=1, metavar='', type=int,
+                            help='''сколько текстов качаем параллельно.
+                            Значение по умолчанию 1 '''
+                            )
+
+    arg_parser.add_argument('--bandwidth', default=0, metavar='', type=int,
+                            help='''сколько килобайт в секунду качаем,
+                            0 - без ограничения. Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--rps', default=10, metavar='', type=float,
+                            help='''максимум запросов к сайту в секунду,
+                            0 - без ограничения. Значение по умолчанию 10 '''
+                            )
+
+    arg_parser.add_argument('--compress', default='none', metavar='',
+                            choices=storage.COMPRESSIONS,
+                            help='''как хранить тексты книг: none - как есть,
+                            gzip - сжатыми в файлы .txt.gz.
+                            Значение по умолчанию none '''
+                            )
+
+    arg_parser.add_argument('--layout', default='flat', metavar='',
+                            choices=storage.LAYOUTS,
+                            help='''раскладка папок, в которой скачаны книги.
+                            Значение по умолчанию flat '''
+                            )
+
+    arg_parser.add_argument('--shard_size', default=storage.SHARD_SIZE,
+                            metavar='', type=int,
+                            help='''сколько id книг в одной подпапке.
+                            Значение по умолчанию 1000 '''
+                            )
+
+    return arg_parser
+
+
+def main():
+    configure_logging()
+
+    parser = create_arg_parser()
+    args = parser.parse_args()
+    logger.debug('argparse %s', args)
+
+    if not args.json_path and not args.metadata_db:
+        logger.critical('Укажите --json_path или --metadata_db')
+        raise KeyboardInterrupt
+    for path in (args.json_path, args.metadata_db):
+        if path and not os.path.exists(path):
+            logger.critical('Нет файла %s', path)
+            raise KeyboardInterrupt
+
+    storage.set_compression(args.compress)
+    storage.set_layout(args.layout, args.shard_size)
+    http_client.configure(max_rps=args.rps)
+    download_scheduler = None
+    if args.bandwidth:
+        download_scheduler = scheduler.enable(args.bandwidth * 1024)
+
+    downloaded = {}
+    if args.json_path:
+        backfill_json(
+            args.json_path,
+            args.dest_folder,
+            args.workers,
+            downloaded
+        )
+    if args.metadata_db:
+        backfill_metadata_db(
+            args.metadata_db,
+            args.dest_folder,
+            args.workers,
+            downloaded
+        )
+    logger.info('Докачано текстов: %s', len(downloaded))
+
+    if download_scheduler is not None:
+        logger.info(download_scheduler.report())
+
+
+if __name__ == '__main__':
+    try:
+        main()
+
+    except KeyboardInterrupt:
+        logger.info('Работа скрипта остановлена')
+
+    finally:
+        sys.exit()
@@ -0,0 +1,105 @@
+"""Сколько памяти занимает одна книга (Book) на большом обходе.
+
+Сравнивает прежнее представление (обычный dataclass со списками плюс
+копия asdict, которую держал пайплайн категории) с текущим Book.
+Строки для каждой книги создаются заново, как после парсинга страницы,
+поэтому одинаковые авторы и жанры - разные объекты, пока их не
+интернировать.
+
+    python3 benchmarks/book_memory.py --books 100000
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+from dataclasses import asdict
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import Book  # noqa: E402
+
+
+@dataclass
+class LegacyBook:
+    id: int
+    title: str
+    author: str
+    comments: list
+    genres: list
+    download_link: str = ''
+    poster_link: str = ''
+    book_saved_path: str = ''
+    poster_saved_path: str = ''
+
+
+AUTHORS = ['Автор {}'.format(number) for number in range(500)]
+GENRES = ['Жанр {}'.format(number) for number in range(40)]
+
+
+def make_page(book_id: int, rng: random.Random) -> dict:
+    return {
+        'id': book_id,
+        'title': ''.join(['Книга ', str(book_id)]),
+        'author': rng.choice(AUTHORS).encode().decode(),
+        'comments': [
+            ''.join(['Комментарий ', str(book_id), ' ', 'текст ' * 20])
+            for _ in range(rng.randint(0, 6))
+        ],
+        'genres': [
+            genre.encode().decode()
+            for genre in rng.sample(GENRES, rng.randint(1, 3))
+        ],
+        'download_link': 'https://tululu.org/txt.php?id={}'.format(book_id),
+        'poster_link': 'https://tululu.org/shots/{}.jpg'.format(book_id),
+        'book_saved_path': 'books/{}. Книга {}.txt'.format(book_id, book_id),
+        'poster_saved_path': 'images/{}.jpg'.format(book_id),
+    }
+
+
+def measure(books_count: int, build) -> float:
+    rng = random.Random(42)
+    tracemalloc.start()
+    kept = [build(make_page(book_id, rng)) for book_id in range(books_count)]
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return used / books_count
+
+
+def build_legacy(page: dict):
+    return LegacyBook(**page)
+
+
+def build_legacy_with_copy(page: dict):
+    book = LegacyBook(**page)
+    return book, asdict(book)
+
+
+def build_compact(page: dict):
+    return Book(**page)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--books', default=100000, type=int,
+                            help='сколько книг держим в памяти')
+    args = arg_parser.parse_args()
+
+    legacy_with_copy = measure(args.books, build_legacy_with_copy)
+    legacy = measure(args.books, build_legacy)
+    compact = measure(args.books, build_compact)
+    print('книг: {}'.format(args.books))
+    print('dataclass + asdict: {:.0f} байт на книгу'.format(legacy_with_copy))
+    print('dataclass:          {:.0f} байт на книгу'.format(legacy))
+    print('Book (slots):       {:.0f} байт на книгу'.format(compact))
+    print('экономия:           {:.0%} и {:.0%}'.format(
+        1 - compact / legacy_with_copy,
+        1 - compact / legacy
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Бенчмарки парсера и скачивания на локальной замене tululu.org.
+
+Замеряет время парсинга одной страницы (bs4 и lxml, из строки и из
+байтов ответа), сколько книг в секунду качают fetch_books и пайплайн
+категории, через сколько готовы страницы книг рядом с большими
+текстами, и пиковую память процесса. Результат печатается и
+сохраняется в json, чтобы сравнивать запуски между собой.
+
+    python3 benchmarks/run_benchmarks.py --books 500 --latency 0.05
+"""
+import os
+import sys
+import json
+import logging
+import time
+import platform
+import argparse
+import resource
+import tempfile
+
+import requests
+
+from datetime import datetime
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import parser  # noqa: E402
+import scheduler  # noqa: E402
+import services  # noqa: E402
+import stand_in_server  # noqa: E402
+
+from pipeline import run_pipeline  # noqa: E402
+from services import fetch_books  # noqa: E402
+from services import iter_book_ids_in_range_pages_in_category  # noqa: E402
+
+
+def get_peak_memory() -> int:
+    """Пиковая память процесса в килобайтах (ru_maxrss)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak // 1024
+    return peak
+
+
+def bench_parser(repeat: int, site_settings) -> list[dict]:
+    book_pages = [
+        stand_in_server.render_book_page(book_id, site_settings)
+        for book_id in range(1, 21)
+    ]
+    category_page = stand_in_server.render_category_page(1, 1, site_settings)
+    results = []
+    for backend in parser.BACKENDS:
+        parser.set_backend(backend)
+        cases = [
+            ('book_page', parser.parse_book_page, book_pages),
+            ('category_page', parser.parse_category_listing, [category_page]),
+        ]
+        for name, parse, pages in cases:
+            started_at = time.process_time()
+            for number in range(repeat):
+                parse(pages[number % len(pages)])
+            elapsed = time.process_time() - started_at
+            results.append({
+                'name': 'parse.{}.{}'.format(backend, name),
+                'value': elapsed / repeat * 1000,
+                'unit': 'ms/page',
+            })
+    parser.set_backend('bs4')
+    return results
+
+
+def make_response(content: bytes, content_type: str | None):
+    """Ответ requests как от сайта, с заголовком Content-Type или без."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    if content_type:
+        response.headers['Content-Type'] = content_type
+    response.encoding = requests.utils.get_encoding_from_headers(
+        response.headers
+    )
+    return response
+
+
+def get_best_time(run, rounds: int) -> float:
+    """Лучшее время из нескольких прогонов, чтобы шум машины не
+    перекрывал разницу в доли миллисекунды."""
+    timings = []
+    for _ in range(max(rounds, 1)):
+        started_at = time.process_time()
+        run()
+        timings.append(time.process_time() - started_at)
+    return min(timings)
+
+
+def bench_decode(repeat: int, site_settings) -> list[dict]:
+    """Сколько стоит путь страницы от байтов ответа до парсера.
+
+    text_detect - response.text без charset в заголовке (requests
+    угадывает кодировку по всей странице), text_header - response.text
+    с charset, bytes - байты ответа как есть. decode.<вариант> - только
+    подготовка страницы, decode.<парсер>.<вариант> - вместе с разбором.
+    """
+    book_pages = [
+        stand_in_server.render_book_page(book_id, site_settings).encode(
+            parser.SITE_ENCODING,
+            errors='replace'
+        )
+        for book_id in range(1, 21)
+    ]
+    cases = [
+        ('text_detect', None, lambda response: response.text),
+        (
+            'text_header',
+            'text/html; charset=windows-1251',
+            lambda response: response.text
+        ),
+        ('bytes', None, lambda response: response.content),
+    ]
+    rounds = repeat // len(book_pages)
+    results = []
+    for name, content_type, prepare in cases:
+        responses = [
+            make_response(content, content_type)
+            for content in book_pages
+        ]
+        elapsed = get_best_time(
+            lambda: [prepare(response) for response in responses],
+            rounds
+        )
+        results.append({
+            'name': 'decode.{}'.format(name),
+            'value': elapsed / len(responses) * 1000,
+            'unit': 'ms/page',
+        })
+        for backend in parser.BACKENDS:
+            parser.set_backend(backend)
+            elapsed = get_best_time(
+                lambda: [
+                    parser.parse_book_page(prepare(response))
+                    for response in responses
+                ],
+                rounds
+            )
+            results.append({
+                'name': 'decode.{}.{}'.format(backend, name),
+                'value': elapsed / len(responses) * 1000,
+                'unit': 'ms/page',
+            })
+    parser.set_backend('bs4')
+    return results
+
+
+def bench_schedule(args, site_settings) -> list[dict]:
+    """Через сколько секунд готовы страницы всех книг, пока рядом
+    качаются тексты по 1 МБ, и сколько идёт весь обход.
+
+    Канал --bandwidth (по умолчанию 4 МБ/сек.) общий на все запросы.
+    off - без планировщика: канал поровну делится между соединениями,
+    и тексты занимают почти все. scheduler - сайт не ограничивает
+    ответы, канал раздаёт планировщик по приоритетам, текстов качается
+    не больше четверти от --workers одновременно. Канал тратится на
+    сжатые байты: с gzip тексты сжимаются во много раз и канал почти
+    не занят, разница в приоритетах видна с --no_gzip.
+    """
+    link_bandwidth = args.bandwidth or 4 * 1024 * 1024
+    saved_settings = (site_settings.text_size, site_settings.bandwidth)
+    site_settings.text_size = 1024 * 1024
+    get_book = services.get_book
+    results = []
+    try:
+        for mode in ('off', 'scheduler'):
+            scheduler.scheduler = None
+            site_settings.bandwidth = link_bandwidth // max(args.workers, 1)
+            if mode == 'scheduler':
+                site_settings.bandwidth = 0
+                scheduler.enable(
+                    link_bandwidth,
+                    {'txt': max(args.workers // 4, 1)}
+                )
+            pages_ready_at = []
+
+            def get_book_timed(book_id):
+                book = get_book(book_id)
+                pages_ready_at.append(time.perf_counter())
+                return book
+
+            services.get_book = get_book_timed
+            started_at = time.perf_counter()
+            with tempfile.TemporaryDirectory() as dest_folder:
+                fetch_books(
+                    range(1, args.books + 1),
+                    dest_folder,
+                    workers=args.workers
+                )
+            finished_at = time.perf_counter()
+            results.extend([
+                {'name': 'schedule.{}.pages_ready'.format(mode),
+                 'value': max(pages_ready_at) - started_at, 'unit': 's'},
+                {'name': 'schedule.{}.total'.format(mode),
+                 'value': finished_at - started_at, 'unit': 's'},
+            ])
+    finally:
+        services.get_book = get_book
+        scheduler.scheduler = None
+        site_settings.text_size, site_settings.bandwidth = saved_settings
+    return results
+
+
+def bench_crawl(name: str, crawl, site_settings) -> list[dict]:
+    stats_before = dict(site_settings.stats)
+    started_at = time.perf_counter()
+    with tempfile.TemporaryDirectory() as dest_folder:
+        books_count = crawl(dest_folder)
+    elapsed = time.perf_counter() - started_at
+    bytes_sent = (
+        site_settings.stats.get('bytes_sent', 0)
+        - stats_before.get('bytes_sent', 0)
+    )
+    return [
+        {'name': '{}.books_per_sec'.format(name),
+         'value': books_count / elapsed, 'unit': 'books/s'},
+        {'name': '{}.megabytes_per_sec'.format(name),
+         'value': bytes_sent / elapsed / 1024 / 1024, 'unit': 'MB/s'},
+        {'name': '{}.peak_memory'.format(name),
+         'value': get_peak_memory(), 'unit': 'KB'},
+    ]
+
+
+def create_arg_parser():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--books', default=200, type=int,
+                            help='сколько книг качает fetch_books')
+    arg_parser.add_argument('--category_pages', default=8, type=int,
+                            help='сколько страниц категории качает пайплайн')
+    arg_parser.add_argument('--workers', default=10, type=int,
+                            help='сколько книг качаем параллельно')
+    arg_parser.add_argument('--parse_repeat', default=200, type=int,
+                            help='сколько раз парсим каждую страницу')
+    arg_parser.add_argument('--latency', default=0.02, type=float,
+                            help='задержка ответа сервера в секундах')
+    arg_parser.add_argument('--bandwidth', default=0, type=int,
+                            help='скорость отдачи ответа, байт в секунду')
+    arg_parser.add_argument('--error_rate', default=0, type=float,
+                            help='доля ответов 429/503')
+    arg_parser.add_argument('--no_gzip', action='store_true',
+                            help='сервер отдаёт ответы без сжатия')
+    arg_parser.add_argument('--only', default='', type=str,
+                            help='запустить только бенчмарки с этим префиксом')
+    arg_parser.add_argument('--output', default='benchmark_results.json',
+                            type=str, help='куда сохранить результат')
+    return arg_parser
+
+
+def main():
+    args = create_arg_parser().parse_args()
+    logging.disable(logging.ERROR)
+    site_settings = stand_in_server.SiteSettings(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        category_pages=args.category_pages,
+        gzip=not args.no_gzip
+    )
+    server, base_url = stand_in_server.start(site_settings)
+    http_client.configure(
+        base_url=base_url,
+        max_rps=0,
+        max_per_host=args.workers,
+        backoff_base=0.01
+    )
+
+    def crawl_books(dest_folder):
+        books = fetch_books(
+            range(1, args.books + 1),
+            dest_folder,
+            workers=args.workers
+        )
+        return len(books)
+
+    def crawl_category(dest_folder):
+        book_ids = iter_book_ids_in_range_pages_in_category(
+            1,
+            1,
+            args.category_pages + 1
+        )
+        return run_pipeline(
+            book_ids,
+            dest_folder,
+            False,
+            False,
+            args.workers,
+            args.workers,
+            100,
+            None
+        )
+
+    benchmarks = [
+        ('parse', lambda: bench_parser(args.parse_repeat, site_settings)),
+        ('decode', lambda: bench_decode(args.parse_repeat, site_settings)),
+        ('fetch_books', lambda: bench_crawl(
+            'fetch_books', crawl_books, site_settings)),
+        ('category_pipeline', lambda: bench_crawl(
+            'category_pipeline', crawl_category, site_settings)),
+        ('schedule', lambda: bench_schedule(args, site_settings)),
+    ]
+    results = []
+    try:
+        for name, bench in benchmarks:
+            if name.startswith(args.only):
+                results.extend(bench())
+    finally:
+        server.shutdown()
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'settings': vars(args),
+        'server_stats': site_settings.stats,
+        'results': results,
+    }
+    with open(args.output, mode='w', encoding='utf-8') as file:
+        json.dump(report, file, indent=4, ensure_ascii=False)
+
+    for result in results:
+        print('{name:<40} {value:>12.3f} {unit}'.format(**result))
+    print('Результат сохранён в {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Локальная замена tululu.org для бенчмарков.
+
+Отдаёт синтетические страницы книг, страницы категорий (строки
+table.d_book и пагинация .npage), тексты txt.php и обложки. Задержка
+ответа, скорость отдачи и доля ответов с ошибками настраиваются.
+Текстовые ответы сжимаются в gzip, если клиент прислал Accept-Encoding.
+"""
+import re
+import gzip
+import time
+import random
+import threading
+
+from dataclasses import dataclass
+from dataclasses import field
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+BOOK_PAGE = '''<html><head><meta charset="windows-1251">
+<title>{title} - {author}</title></head><body>
+<table><tr><td>{menu}</td></tr></table>
+<div id="content">
+<h1>{title} &nbsp;::&nbsp; <a href="/a{author_id}/">{author}</a></h1>
+<table class="d_book"><tr><td>
+<div class="bookimage"><a href="/b{book_id}/"><img src="{poster}"
+alt="{title}"></a></div></td><td>
+<span class="d_book"><b>Жанр книги:</b> {genres}</span>
+</td></tr></table>
+<table class="d_book"><tr><td><a href="/txt.php?id={book_id}">скачать
+txt</a></td></tr></table>
+{comments}
+</div></body></html>'''
+
+GENRE_LINK = '<a href="/l{genre_id}/" title="{genre}">{genre}</a>'
+
+COMMENT = ('<div class="texts"><b>Читатель {number}</b> '
+           '<span class="black">{text}</span></div>')
+
+CATEGORY_PAGE = '''<html><head><meta charset="windows-1251"></head><body>
+<table><tr><td>{menu}</td></tr></table>
+<div id="content"><h1>Категория {category_id}</h1>
+{rows}
+<p class="center">{pages}</p>
+</div></body></html>'''
+
+CATEGORY_ROW = '''<table class="d_book"><tr><td><div class="bookimage">
+<a href="/b{book_id}/"><img src="/images/nopic.gif"></a></div></td>
+<td><b><a href="/b{book_id}/">Книга {book_id}</a></b></td></tr></table>'''
+
+PAGE_LINK = '<a class="npage" href="/l{category_id}/{page}/">{page}</a>'
+
+MENU = ''.join(
+    '<a href="/l{0}/">Раздел {0}</a> '.format(number)
+    for number in range(400)
+)
+
+GENRES = [
+    'Научная фантастика', 'Фантастика', 'Проза', 'Детектив', 'Приключения',
+    'Поэзия', 'Философия', 'История', 'Биография', 'Юмор',
+]
+
+WORDS = (
+    'книга автор сюжет герой читать интересно понравилось финал '
+    'перевод язык мир время'
+).split()
+
+
+@dataclass
+class SiteSettings:
+    latency: float = 0
+    bandwidth: int = 0
+    error_rate: float = 0
+    redirect_every: int = 7
+    books_per_page: int = 25
+    category_pages: int = 10
+    comments: int = 8
+    text_size: int = 200 * 1024
+    poster_size: int = 20 * 1024
+    gzip: bool = True
+    seed: int = 42
+    stats: dict = field(default_factory=dict)
+
+
+def render_book_page(book_id: int, settings: SiteSettings) -> str:
+    rng = random.Random(settings.seed * 1000003 + book_id)
+    author_id = rng.randrange(500)
+    genres = rng.sample(range(len(GENRES)), rng.randint(1, 3))
+    comments = []
+    for number in range(rng.randint(0, settings.comments)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 60))]
+        comments.append(COMMENT.format(number=number, text=' '.join(words)))
+    poster = (
+        '/images/nopic.gif' if book_id % 3 == 0
+        else '/shots/{}.jpg'.format(book_id)
+    )
+    return BOOK_PAGE.format(
+        book_id=book_id,
+        title='Книга {}'.format(book_id),
+        author='Автор {}'.format(author_id),
+        author_id=author_id,
+        poster=poster,
+        genres=', '.join(
+            GENRE_LINK.format(genre_id=genre_id, genre=GENRES[genre_id])
+            for genre_id in genres
+        ),
+        comments='\n'.join(comments),
+        menu=MENU
+    )
+
+
+def render_category_page(
+        category_id: int,
+        page: int,
+        settings: SiteSettings
+) -> str:
+    first_book_id = (page - 1) * settings.books_per_page + 1
+    rows = '\n'.join(
+        CATEGORY_ROW.format(book_id=book_id)
+        for book_id in range(
+            first_book_id,
+            first_book_id + settings.books_per_page
+        )
+    )
+    pages = ' '.join(
+        PAGE_LINK.format(category_id=category_id, page=number)
+        for number in range(1, settings.category_pages + 1)
+    )
+    return CATEGORY_PAGE.format(
+        category_id=category_id,
+        rows=rows,
+        pages=pages,
+        menu=MENU
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = SiteSettings()
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, key: str, value: int = 1):
+        with self.stats_lock:
+            stats = self.settings.stats
+            stats[key] = stats.get(key, 0) + value
+
+    def send(self, status: int, body: bytes, content_type: str,
+             headers=None):
+        self.count('status_{}'.format(status))
+        headers = dict(headers or {})
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        if (self.settings.gzip and 'gzip' in accept_encoding
+                and content_type.startswith('text/') and len(body) > 1024):
+            body = gzip.compress(body, compresslevel=5, mtime=0)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        bandwidth = self.settings.bandwidth
+        chunk_size = min(bandwidth, 16 * 1024) if bandwidth else len(body)
+        for start in range(0, len(body), max(chunk_size, 1)):
+            self.wfile.write(body[start:start + chunk_size])
+            if bandwidth:
+                time.sleep(chunk_size / bandwidth)
+        self.count('bytes_sent', len(body))
+
+    def send_html(self, html: str):
+        self.send(
+            200,
+            html.encode('cp1251', errors='replace'),
+            'text/html; charset=windows-1251'
+        )
+
+    def do_GET(self):
+        settings = self.settings
+        if settings.latency:
+            time.sleep(settings.latency)
+        if settings.error_rate and random.random() < settings.error_rate:
+            status = random.choice([429, 503])
+            self.send(status, b'busy', 'text/plain', {'Retry-After': '0'})
+            return
+
+        url = urlsplit(self.path)
+        path = url.path
+        book_match = re.fullmatch(r'/b(\d+)/', path)
+        category_match = re.fullmatch(r'/l(\d+)/(?:(\d+)/)?', path)
+        if book_match:
+            book_id = int(book_match.group(1))
+            redirect_every = settings.redirect_every
+            if redirect_every and not book_id % redirect_every:
+                self.send(302, b'', 'text/html', {'Location': '/'})
+                return
+            self.send_html(render_book_page(book_id, settings))
+        elif category_match:
+            self.send_html(render_category_page(
+                int(category_match.group(1)),
+                int(category_match.group(2) or 1),
+                settings
+            ))
+        elif path == '/txt.php':
+            book_id = parse_qs(url.query).get('id', ['0'])[0]
+            line = 'Текст книги {}. '.format(book_id).encode()
+            body = line * (settings.text_size // len(line) + 1)
+            self.send(200, body[:settings.text_size],
+                      'text/plain; charset=utf-8')
+        elif path.startswith(('/shots/', '/images/')):
+            body = b'GIF89a' + path.encode() * (settings.poster_size // 16)
+            self.send(200, body[:settings.poster_size], 'image/gif')
+        elif path == '/':
+            self.send_html('<html><body>{}</body></html>'.format(MENU))
+        else:
+            self.send(404, b'not found', 'text/plain')
+
+
+def start(settings: SiteSettings | None = None, port: int = 0):
+    """Запускает сервер в фоновом потоке.
+
+    :param settings: настройки сайта.
+    :param port: порт, 0 - любой свободный.
+
+    :return: tuple(сервер, адрес сайта со слэшем в конце).
+    """
+    handler = type(
+        'Handler',
+        (StandInHandler,),
+        {'settings': settings or SiteSettings()}
+    )
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/'.format(server.server_address[1])
@@ -0,0 +1,172 @@
+import os
+import json
+import atexit
+import shutil
+import logging
+import threading
+
+from storage import CHUNK_SIZE
+from storage import AtomicFileWriter
+from storage import ensure_folder
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Хранилище файлов по хэшу содержимого (sha256).
+
+    Одинаковые файлы хранятся один раз в root/blobs/<2 символа>/<хэш>,
+    индекс url -> хэш позволяет не ходить в сеть за уже скаченными url.
+    В папку с результатом файлы попадают жёсткой ссылкой (если не
+    получилось - символической, если и она не получилась - копией).
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: папка хранилища.
+        """
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        self.index = {}
+        self.hits = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, mode='r', encoding='utf-8') as file:
+                self.index = json.load(file)
+        logger.debug('В индексе хранилища %s url', len(self.index))
+
+    def get_blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def lookup(self, url: str) -> str | None:
+        """Ищем уже скаченный url.
+
+        :param url: ссылка на файл.
+
+        :return: str - хэш содержимого или None если url не скачивали.
+        """
+        digest = self.index.get(url)
+        if digest is None or not os.path.exists(self.get_blob_path(digest)):
+            return None
+        with self._lock:
+            self.hits += 1
+        return digest
+
+    def open_writer(self) -> AtomicFileWriter:
+        """Временный файл для скачивания нового содержимого.
+
+        После записи его нужно передать в add.
+        """
+        return AtomicFileWriter(self.root, 'download')
+
+    def add(self, writer: AtomicFileWriter, url: str) -> str:
+        """Кладёт записанное содержимое в хранилище.
+
+        Если такое содержимое уже есть, временный файл не сохраняется.
+
+        :param writer: открытый writer из open_writer с записанным файлом.
+        :param url: откуда скачали.
+
+        :return: str - хэш содержимого.
+        """
+        digest = writer.sha256
+        blob_path = self.get_blob_path(digest)
+        if os.path.exists(blob_path):
+            with self._lock:
+                self.deduplicated += 1
+            logger.debug('Содержимое %s уже есть в хранилище', url)
+        else:
+            ensure_folder(os.path.dirname(blob_path))
+            writer.commit(blob_path)
+        with self._lock:
+            self.index[url] = digest
+        return digest
+
+    def add_file(self, path: str, url: str) -> str:
+        """Кладёт в хранилище уже сохранённый файл.
+
+        Нужно когда сайт ответил 304 на условный запрос: содержимое
+        не скачивали, оно лежит в папке с результатом.
+
+        :param path: путь до сохранённого файла.
+        :param url: откуда его скачали.
+
+        :return: str - хэш содержимого.
+        """
+        with self.open_writer() as writer:
+            with open(path, mode='rb') as file:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                    writer.write(chunk)
+            return self.add(writer, url)
+
+    def materialize(self, digest: str, folder: str, filename: str) -> str:
+        """Кладёт файл из хранилища в папку с результатом.
+
+        :param digest: хэш содержимого.
+        :param folder: папка для сохранения.
+        :param filename: имя файла.
+
+        :return: str - путь до файла
+        """
+        blob_path = self.get_blob_path(digest)
+        path_to_save = os.path.join(folder, filename)
+        ensure_folder(folder)
+        already_linked = (
+            os.path.exists(path_to_save)
+            and os.path.samefile(path_to_save, blob_path)
+        )
+        if already_linked:
+            return path_to_save
+
+        tmp_path = '{}.{}.part'.format(path_to_save, threading.get_ident())
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(blob_path), tmp_path)
+            except OSError:
+                shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, path_to_save)
+        return path_to_save
+
+    def save(self):
+        """Сохраняет индекс url -> хэш на диск (через временный файл)."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = '{}.tmp'.format(self.index_path)
+        with self._lock:
+            with open(tmp_path, mode='w', encoding='utf-8') as file:
+                json.dump(self.index, file, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def report(self) -> str:
+        """Отчёт о сэкономленных скачиваниях.
+
+        :return: str - строка отчёта.
+        """
+        return (
+            'Обложек взято из хранилища без скачивания: {}, '
+            'скачано повторяющихся: {}'.format(self.hits, self.deduplicated)
+        )
+
+
+store = None
+
+
+def enable(root: str) -> BlobStore:
+    """Включает хранилище обложек по хэшу.
+
+    Индекс сохраняется на диск при выходе из скрипта, в том числе после
+    ошибки или Ctrl-C, иначе скаченные обложки останутся в хранилище
+    без записи в индексе и будут скачаны заново.
+
+    :param root: папка хранилища.
+
+    :return: BlobStore - хранилище.
+    """
+    global store
+    store = BlobStore(root)
+    atexit.register(store.save)
+    logger.info('Хранилище обложек: %s', root)
+    return store
@@ -0,0 +1,87 @@
+import os
+import sys
+import logging
+import argparse
+
+from metadata_store import MetadataStore
+from services import configure_logging
+from services import save_books_as_json_file
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_arg_parser():
+    description = 'Выгружаем книги из базы в json'
+    epilog = """
+    Формат json тот же, что у downloaded_books_info.json
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=description,
+        epilog=epilog
+    )
+    arg_parser.add_argument('--metadata_db', default='books.sqlite3',
+                            metavar='', type=str,
+                            help='''файл SQLite с информацией о книгах.
+                            Значение по умолчанию books.sqlite3 '''
+                            )
+
+    arg_parser.add_argument('--json_path', default='./', metavar='',
+                            type=str,
+                            help='''путь до каталога с результатом.
+                            Значение по умолчанию ./ '''
+                            )
+
+    arg_parser.add_argument('--filename', default='downloaded_books_info.json',
+                            metavar='', type=str,
+                            help='''имя файла с результатом.
+                            Значение по умолчанию downloaded_books_info.json '''
+                            )
+
+    arg_parser.add_argument('--category_id', default=None, metavar='',
+                            type=int,
+                            help='''выгрузить только книги этой категории '''
+                            )
+
+    arg_parser.add_argument('--author', default=None, metavar='', type=str,
+                            help='''выгрузить только книги этого автора '''
+                            )
+
+    arg_parser.add_argument('--genre', default=None, metavar='', type=str,
+                            help='''выгрузить только книги этого жанра '''
+                            )
+
+    return arg_parser
+
+
+def main():
+    configure_logging()
+
+    parser = create_arg_parser()
+    args = parser.parse_args()
+    logger.debug('argparse %s', args)
+
+    if not os.path.exists(args.metadata_db):
+        logger.critical('Нет базы книг %s', args.metadata_db)
+        raise KeyboardInterrupt
+
+    book_store = MetadataStore(args.metadata_db)
+    try:
+        save_books_as_json_file(
+            args.filename,
+            book_store.iter_books(args.category_id, args.author, args.genre),
+            args.json_path
+        )
+    finally:
+        book_store.close()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+
+    except KeyboardInterrupt:
+        logger.info('Работа скрипта остановлена')
+
+    finally:
+        sys.exit()
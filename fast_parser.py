@@ -0,0 +1,196 @@
+import re
+import logging
+import threading
+
+from lxml import etree
+from lxml import html
+
+logger = logging.getLogger(__name__)
+
+
+def _has_class(class_name: str) -> str:
+    return (
+        "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+        .format(class_name)
+    )
+
+
+_LINK = '(self::a or self::area) and @href'
+
+BOOK_TITLE = etree.XPath('//*[@id="content"]//h1')
+BOOK_POSTER = etree.XPath('//*[{}]//img'.format(_has_class('bookimage')))
+BOOK_COMMENTS = etree.XPath('//*[{}]//span'.format(_has_class('texts')))
+BOOK_GENRES = etree.XPath(
+    '//span[{}]//*[{}]'.format(_has_class('d_book'), _LINK)
+)
+CATEGORY_BOOK_TABLES = etree.XPath(
+    '//table[{}]'.format(_has_class('d_book'))
+)
+CATEGORY_BOOK_LINK = etree.XPath('(.//*[{}])[1]'.format(_LINK))
+CATEGORY_PAGES = etree.XPath('//*[{}]'.format(_has_class('npage')))
+LINKS = etree.XPath('//a/@href')
+
+CATEGORY_LINK = re.compile(r'(?:^|//[^/]+)/l(\d+)/?$')
+
+_parsers = threading.local()
+
+
+def _get_html_parser(encoding: str) -> html.HTMLParser:
+    parsers = getattr(_parsers, 'by_encoding', None)
+    if parsers is None:
+        parsers = _parsers.by_encoding = {}
+    parser = parsers.get(encoding)
+    if parser is None:
+        parser = parsers[encoding] = html.HTMLParser(encoding=encoding)
+    return parser
+
+
+def parse_document(html_content: str | bytes, encoding: str | None = None):
+    """Разбираем html через lxml.
+
+    Байты декодирует сам libxml2 в кодировке encoding, без промежуточной
+    строки python. Парсер на каждую кодировку свой в каждом потоке.
+
+    :param html_content: html страницы (строка или байты ответа).
+    :param encoding: кодировка байтов, None - по meta страницы.
+
+    :return: корень разобранного документа.
+    """
+    if isinstance(html_content, bytes) and encoding:
+        return html.document_fromstring(
+            html_content,
+            parser=_get_html_parser(encoding)
+        )
+    return html.document_fromstring(html_content)
+
+
+def parse_book_page(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> dict:
+    """Парсим информацию по книге с сайта tululu.org через lxml.
+
+    Результат совпадает с parser.parse_book_page.
+
+    :param html_content: html страницы книги.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: dict - данные по книге.
+    """
+    logger.debug('Парсим информацию о книге (lxml)')
+    tree = parse_document(html_content, encoding)
+
+    split_title_tag = BOOK_TITLE(tree)[0].text_content().split('::')
+
+    book = {
+        'title': split_title_tag[0].strip(),
+        'author': split_title_tag[1].strip(),
+        'comments': [str(span.text_content()) for span in BOOK_COMMENTS(tree)],
+        'genres': [str(link.text_content()) for link in BOOK_GENRES(tree)],
+        'poster_link': BOOK_POSTER(tree)[0].attrib['src']
+    }
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            'Полученная информация о книге: %s :: %s, жанры %s, '
+            'комментариев %s',
+            book['title'],
+            book['author'],
+            book['genres'],
+            len(book['comments'])
+        )
+    return book
+
+
+def parse_category_page(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> list[int]:
+    """Парсим страницу с книгами по категории сайта tululu.org через lxml.
+
+    :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: list - список id книг из категории.
+    """
+    logger.debug('Парсим информацию о книгах со страницы категории (lxml)')
+    return find_book_ids(parse_document(html_content, encoding))
+
+
+def get_number_of_pages_in_category(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> int:
+    """Получаем количество страниц категории книг через lxml.
+
+    :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: int - количество страниц категории книг.
+    """
+    logger.debug('Получаем информацию о количестве страниц категории книг')
+    return find_number_of_pages(parse_document(html_content, encoding))
+
+
+def parse_category_listing(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> tuple[int, list[int]]:
+    """Парсим страницу категории один раз: количество страниц и id книг.
+
+    :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: tuple(количество страниц категории, список id книг на странице).
+    """
+    logger.debug('Парсим страницу категории (lxml)')
+    tree = parse_document(html_content, encoding)
+    return find_number_of_pages(tree), find_book_ids(tree)
+
+
+def parse_category_ids(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> list[int]:
+    """Ищем id всех категорий в ссылках страницы через lxml.
+
+    :param html_content: html страницы сайта с меню жанров.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: list - id категорий по возрастанию.
+    """
+    logger.debug('Ищем категории на странице (lxml)')
+    category_ids = set()
+    for link in LINKS(parse_document(html_content, encoding)):
+        match = CATEGORY_LINK.search(link.strip())
+        if match:
+            category_ids.add(int(match.group(1)))
+    return sorted(category_ids)
+
+
+def find_book_ids(tree) -> list[int]:
+    book_ids = []
+    for table in CATEGORY_BOOK_TABLES(tree):
+        book_link = CATEGORY_BOOK_LINK(table)[0].get('href')
+        book_ids.append(int(re.sub(r'\D', '', book_link)))
+
+    logger.debug('Cписок id найденный книг %s', book_ids)
+    return book_ids
+
+
+def _is_last_of_type(element) -> bool:
+    sibling = element.getnext()
+    while sibling is not None:
+        if sibling.tag == element.tag:
+            return False
+        sibling = sibling.getnext()
+    return True
+
+
+def find_number_of_pages(tree) -> int:
+    for page in CATEGORY_PAGES(tree):
+        if _is_last_of_type(page):
+            return int(page.text_content())
+
+    logger.warning('Внимание. У категории только 1 страница книг')
+    return 1
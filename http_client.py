@@ -0,0 +1,200 @@
+import re
+import time
+import logging
+import threading
+
+import requests
+
+import metrics
+
+from dataclasses import dataclass
+from dataclasses import replace
+from requests.adapters import HTTPAdapter
+
+from rate_limit import RETRY_STATUSES
+from rate_limit import AdaptiveRateLimiter
+from rate_limit import get_backoff_delay
+from rate_limit import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    base_url: str = 'https://tululu.org/'
+    pool_size: int = 10
+    max_per_host: int = 10
+    keep_alive: bool = True
+    connect_timeout: float = 5
+    read_timeout: float = 30
+    max_rps: float = 10
+    max_attempts: int = 5
+    backoff_base: float = 1
+    backoff_max: float = 60
+    accept_encoding: str = 'gzip, deflate'
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+
+settings = ClientSettings()
+limiter = AdaptiveRateLimiter(settings.max_rps)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure(**kwargs) -> ClientSettings:
+    """Меняет настройки общего HTTP клиента.
+
+    Уже созданная сессия закрывается, следующий запрос откроет новую
+    с новыми настройками.
+
+    :param kwargs: поля ClientSettings, которые нужно поменять.
+
+    :return: ClientSettings - действующие настройки.
+    """
+    global settings, limiter, _session
+    with _session_lock:
+        settings = replace(settings, **kwargs)
+        limiter = AdaptiveRateLimiter(settings.max_rps)
+        if _session is not None:
+            _session.close()
+            _session = None
+    logger.debug('Настройки HTTP клиента: %s', settings)
+    return settings
+
+
+def create_session(client_settings: ClientSettings) -> requests.Session:
+    """Создаёт сессию requests с пулом соединений.
+
+    pool_size - сколько хостов держим в пуле,
+    max_per_host - сколько соединений максимум держим к одному хосту
+    (лишние запросы ждут свободного соединения).
+    Ответы просим сжатыми (accept_encoding), requests распаковывает их сам.
+
+    :param client_settings: настройки клиента.
+
+    :return: requests.Session - сессия с пулом соединений.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=client_settings.pool_size,
+        pool_maxsize=client_settings.max_per_host,
+        pool_block=True
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = client_settings.accept_encoding
+    if not client_settings.keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def get_session() -> requests.Session:
+    """Возвращает общую для всех потоков сессию, создаёт её при первом вызове.
+
+    :return: requests.Session - общая сессия.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session(settings)
+    return _session
+
+
+def get(url: str, params=None, **kwargs) -> requests.Response:
+    """GET запрос через общую сессию с таймаутом по умолчанию.
+
+    Запросы идут не быстрее limiter. Ошибки соединения и ответы
+    429/5xx повторяются до settings.max_attempts раз с экспоненциальной
+    задержкой (или сколько попросил сайт в Retry-After), после чего
+    ошибка соединения пробрасывается, а ответ с ошибкой возвращается.
+
+    :param url: адрес запроса.
+    :param params: параметры запроса.
+    :param kwargs: дополнительные аргументы requests.Session.get.
+
+    :return: requests.Response - ответ сервера.
+    """
+    kwargs.setdefault('timeout', settings.timeout)
+    attempt = 0
+    while True:
+        attempt += 1
+        limiter.acquire()
+        try:
+            with metrics.timer('network'):
+                response = get_session().get(url, params=params, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.add('requests', label='error')
+            if attempt >= settings.max_attempts:
+                raise
+            metrics.add('retries', label='connection')
+            delay = get_backoff_delay(
+                attempt,
+                settings.backoff_base,
+                settings.backoff_max
+            )
+            logger.warning(
+                'Ошибка соединения с %s, повтор через %.1f сек.',
+                url,
+                delay
+            )
+            time.sleep(delay)
+            continue
+
+        limiter.on_response(response.status_code)
+        metrics.add('requests', label=response.status_code)
+        if response.status_code not in RETRY_STATUSES:
+            return response
+        if attempt >= settings.max_attempts:
+            return response
+
+        metrics.add('retries', label=response.status_code)
+        delay = get_retry_delay(attempt, response.headers)
+        logger.warning(
+            'Сайт ответил %s на %s, повтор через %.1f сек.',
+            response.status_code,
+            url,
+            delay
+        )
+        response.close()
+        time.sleep(delay)
+
+
+def get_charset(content_type: str | None) -> str | None:
+    """Кодировка из заголовка Content-Type, без угадывания по телу ответа.
+
+    :param content_type: значение заголовка Content-Type.
+
+    :return: str - кодировка или None, если её нет в заголовке.
+    """
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type or '', re.I)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def get_retry_delay(attempt: int, response_headers) -> float:
+    """Сколько ждать перед повтором запроса после ответа 429/5xx.
+
+    Если сайт прислал Retry-After, ждём сколько он просит и ставим
+    на паузу все остальные запросы.
+
+    :param attempt: номер неудачной попытки (с 1).
+    :param response_headers: заголовки ответа.
+
+    :return: float - сколько секунд ждать.
+    """
+    retry_after = parse_retry_after(response_headers.get('Retry-After'))
+    if retry_after is not None:
+        retry_after = min(retry_after, settings.backoff_max)
+        limiter.pause(retry_after)
+        return retry_after
+    return get_backoff_delay(
+        attempt,
+        settings.backoff_base,
+        settings.backoff_max
+    )
@@ -0,0 +1,218 @@
+import os
+import json
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ValidatorStore:
+    """Валидаторы (ETag, Last-Modified, размер, хэш) сохранённых файлов.
+
+    Нужны для повторного скачивания: по ним отправляем условные запросы
+    и не перезаписываем файлы, которые не поменялись.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: путь до json файла с валидаторами.
+        """
+        self.path = path
+        self.validators = {}
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self.writes_skipped = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, mode='r', encoding='utf-8') as file:
+                self.validators = json.load(file)
+        logger.debug('Загружено валидаторов: %s', len(self.validators))
+
+    def _get_actual(self, file_path: str) -> dict | None:
+        validator = self.validators.get(file_path)
+        if not validator:
+            return None
+        stored_size = validator.get('stored_size', validator['size'])
+        try:
+            if os.path.getsize(file_path) != stored_size:
+                return None
+        except OSError:
+            return None
+        return validator
+
+    def conditional_headers(self, file_path: str) -> dict:
+        """Заголовки условного запроса для уже сохранённого файла.
+
+        :param file_path: куда сохраняем файл.
+
+        :return: dict - заголовки If-None-Match / If-Modified-Since.
+        """
+        validator = self._get_actual(file_path)
+        if not validator:
+            return {}
+        headers = {}
+        if validator.get('etag'):
+            headers['If-None-Match'] = validator['etag']
+        if validator.get('last_modified'):
+            headers['If-Modified-Since'] = validator['last_modified']
+        return headers
+
+    def mark_not_modified(self, file_path: str):
+        """Учитывает ответ 304 - файл не скачивали и не перезаписывали.
+
+        :param file_path: путь до сохранённого файла.
+        """
+        with self._lock:
+            self.not_modified += 1
+            self.bytes_saved += self.validators[file_path]['size']
+            self.writes_skipped += 1
+
+    def is_unchanged(self, file_path: str, size: int, sha256: str) -> bool:
+        """Проверяет совпадает ли скаченное содержимое с сохранённым файлом.
+
+        :param file_path: путь до сохранённого файла.
+        :param size: размер скаченного содержимого.
+        :param sha256: хэш скаченного содержимого.
+
+        :return: bool - True если файл перезаписывать не нужно.
+        """
+        validator = self._get_actual(file_path)
+        if not validator or validator['size'] != size:
+            return False
+        if validator['sha256'] != sha256:
+            return False
+        with self._lock:
+            self.writes_skipped += 1
+        return True
+
+    def remember(
+            self,
+            file_path: str,
+            response_headers,
+            size: int,
+            sha256: str,
+            stored_size: int | None = None
+    ):
+        """Запоминает валидаторы сохранённого файла.
+
+        :param file_path: путь до сохранённого файла.
+        :param response_headers: заголовки ответа сайта.
+        :param size: размер скаченного содержимого.
+        :param sha256: хэш скаченного содержимого.
+        :param stored_size: размер файла на диске, если он сжат.
+            По умолчанию равен size.
+        """
+        validator = {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'size': size,
+            'sha256': sha256,
+            'stored_size': size if stored_size is None else stored_size,
+        }
+        with self._lock:
+            self.validators[file_path] = validator
+
+    def refresh(self, file_path: str, response_headers):
+        """Обновляет ETag и Last-Modified файла, который не поменялся.
+
+        Сайт может отдать то же содержимое с новыми валидаторами, со
+        старыми условный запрос больше не получит 304.
+
+        :param file_path: путь до сохранённого файла.
+        :param response_headers: заголовки ответа сайта.
+        """
+        with self._lock:
+            validator = self.validators.get(file_path)
+            if validator is None:
+                return
+            validator['etag'] = response_headers.get('ETag')
+            validator['last_modified'] = response_headers.get('Last-Modified')
+
+    def save(self):
+        """Сохраняет валидаторы на диск (через временный файл)."""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = '{}.tmp'.format(self.path)
+        with self._lock:
+            with open(tmp_path, mode='w', encoding='utf-8') as file:
+                json.dump(self.validators, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        logger.debug('Сохранено валидаторов: %s', len(self.validators))
+
+    def report(self) -> str:
+        """Отчёт о сэкономленных запросах и байтах.
+
+        :return: str - строка отчёта.
+        """
+        return (
+            'Не изменилось файлов (ответ 304): {}, не скачано байт: {}, '
+            'не перезаписано файлов: {}'.format(
+                self.not_modified,
+                self.bytes_saved,
+                self.writes_skipped
+            )
+        )
+
+
+store = None
+
+
+def enable(path: str) -> ValidatorStore:
+    """Включает инкрементальное скачивание.
+
+    Валидаторы сохраняются на диск при выходе из скрипта, в том числе
+    после ошибки или Ctrl-C: файлы, скаченные до остановки, уже лежат
+    на диске, и следующий запуск не должен качать их заново.
+
+    :param path: путь до json файла с валидаторами.
+
+    :return: ValidatorStore - хранилище валидаторов.
+    """
+    global store
+    store = ValidatorStore(path)
+    atexit.register(store.save)
+    logger.info('Инкрементальное скачивание включено')
+    return store
+
+
+def conditional_headers(file_path: str) -> dict:
+    """Заголовки условного запроса, пустые если режим выключен."""
+    if store is None:
+        return {}
+    return store.conditional_headers(file_path)
+
+
+def mark_not_modified(file_path: str):
+    if store is not None:
+        store.mark_not_modified(file_path)
+
+
+def is_unchanged(file_path: str, size: int, sha256: str) -> bool:
+    if store is None:
+        return False
+    return store.is_unchanged(file_path, size, sha256)
+
+
+def refresh(file_path: str, response_headers):
+    if store is not None:
+        store.refresh(file_path, response_headers)
+
+
+def remember(
+        file_path: str,
+        response_headers,
+        size: int,
+        sha256: str,
+        stored_size: int | None = None
+):
+    if store is not None:
+        store.remember(
+            file_path,
+            response_headers,
+            size,
+            sha256,
+            stored_size
+        )
@@ -0,0 +1,104 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BookJournal:
+    """Журнал скаченных книг в формате JSONL.
+
+    Каждая книга дописывается отдельной строкой сразу после скачивания
+    и сбрасывается на диск, поэтому после падения скрипта журнал содержит
+    все книги, скаченные до падения.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        :param path: путь до файла журнала.
+        :param resume: продолжить существующий журнал, иначе начать заново.
+        """
+        self.path = path
+        self.resume = resume
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        mode = 'a' if self.resume else 'w'
+        self._file = open(self.path, mode=mode, encoding='utf-8')
+        if self.resume and self._file.tell() and not self._ends_with_newline():
+            self._file.write('\n')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, mode='rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def load_ids(self) -> set[int]:
+        """Читает id книг уже записанных в журнал.
+
+        :return: set - id книг из журнала.
+        """
+        book_ids = set()
+        if not self.resume:
+            return book_ids
+
+        for book in self.iter_books():
+            book_ids.add(book['id'])
+
+        logger.info('В журнале %s книг', len(book_ids))
+        return book_ids
+
+    def iter_books(self):
+        """Отдаёт книги из журнала по одной в порядке записи.
+
+        Недописанная при падении строка пропускается, повторы книги
+        отдаются один раз.
+
+        :return: Iterator - книги из журнала.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        seen_book_ids = set()
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    book = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(
+                        'Пропускаю повреждённую строку журнала %s',
+                        self.path
+                    )
+                    continue
+                if book['id'] in seen_book_ids:
+                    continue
+                seen_book_ids.add(book['id'])
+                yield book
+
+    def append(self, book):
+        """Дописывает книгу в журнал и сбрасывает его на диск.
+
+        :param book: скаченная книга (services.Book).
+        """
+        line = book.to_json()
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        logger.debug('Книга %s записана в журнал', book.id)
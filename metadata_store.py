@@ -0,0 +1,208 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BOOK_FIELDS = (
+    'id',
+    'title',
+    'author',
+    'comments',
+    'genres',
+    'download_link',
+    'poster_link',
+    'book_saved_path',
+    'poster_saved_path',
+)
+
+
+class MetadataStore:
+    """Информация о скаченных книгах в SQLite.
+
+    Книга добавляется или обновляется по id (upsert), поэтому книги
+    из разных категорий и запусков копятся в одной базе, а файл
+    не переписывается целиком. Есть индексы по автору и жанру, выгрузка
+    в json в том же формате, что и downloaded_books_info.json.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: путь до файла базы SQLite.
+        """
+        self.path = path
+        self.upserted = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            'PRAGMA journal_mode = WAL;'
+            'PRAGMA synchronous = NORMAL;'
+            'CREATE TABLE IF NOT EXISTS books ('
+            'id INTEGER PRIMARY KEY, title TEXT, author TEXT, '
+            'comments TEXT, genres TEXT, download_link TEXT, '
+            'poster_link TEXT, book_saved_path TEXT, '
+            'poster_saved_path TEXT, updated_at REAL);'
+            'CREATE INDEX IF NOT EXISTS books_author ON books (author);'
+            'CREATE TABLE IF NOT EXISTS book_genres ('
+            'book_id INTEGER, genre TEXT, PRIMARY KEY (book_id, genre));'
+            'CREATE INDEX IF NOT EXISTS book_genres_genre '
+            'ON book_genres (genre);'
+            'CREATE TABLE IF NOT EXISTS book_categories ('
+            'book_id INTEGER, category_id INTEGER, '
+            'PRIMARY KEY (book_id, category_id));'
+            'CREATE INDEX IF NOT EXISTS book_categories_category '
+            'ON book_categories (category_id);'
+        )
+
+    def upsert(self, book: dict, category_ids=()):
+        """Добавляет книгу или обновляет уже сохранённую.
+
+        Категории добавляются к уже записанным у книги. Пустые пути до
+        текста и обложки (качали с --skip_txt или --skip_imgs) не затирают
+        уже сохранённые.
+
+        :param book: книга (Book) или словарь с информацией о книге.
+        :param category_ids: категории, в которых нашли книгу.
+        """
+        row = [book[field] for field in BOOK_FIELDS]
+        row[3] = json.dumps(book['comments'], ensure_ascii=False)
+        row[4] = json.dumps(book['genres'], ensure_ascii=False)
+        row.append(time.time())
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT INTO books VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET '
+                    'title = excluded.title, author = excluded.author, '
+                    'comments = excluded.comments, '
+                    'genres = excluded.genres, '
+                    'download_link = excluded.download_link, '
+                    'poster_link = excluded.poster_link, '
+                    'book_saved_path = COALESCE('
+                    "NULLIF(excluded.book_saved_path, ''), "
+                    'books.book_saved_path), '
+                    'poster_saved_path = COALESCE('
+                    "NULLIF(excluded.poster_saved_path, ''), "
+                    'books.poster_saved_path), '
+                    'updated_at = excluded.updated_at',
+                    row
+                )
+                self._connection.execute(
+                    'DELETE FROM book_genres WHERE book_id = ?',
+                    (book['id'],)
+                )
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO book_genres VALUES (?, ?)',
+                    [(book['id'], genre) for genre in book['genres']]
+                )
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO book_categories VALUES (?, ?)',
+                    [(book['id'], category_id) for category_id in category_ids]
+                )
+            self.upserted += 1
+
+    def add_categories(self, book_categories: dict):
+        """Добавляет книгам категории, в которых их нашли.
+
+        :param book_categories: id книги -> список id категорий.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO book_categories '
+                    'SELECT ?, ? WHERE EXISTS '
+                    '(SELECT 1 FROM books WHERE id = ?)',
+                    [
+                        (book_id, category_id, book_id)
+                        for book_id, category_ids in book_categories.items()
+                        for category_id in category_ids
+                    ]
+                )
+
+    def iter_books(
+            self,
+            category_id: int | None = None,
+            author: str | None = None,
+            genre: str | None = None
+    ):
+        """Книги из базы по возрастанию id.
+
+        Книги читаются по одной через отдельное соединение, поэтому
+        база может быть больше памяти.
+
+        :param category_id: только книги этой категории.
+        :param author: только книги этого автора.
+        :param genre: только книги этого жанра.
+
+        :return: генератор словарей с информацией о книгах.
+        """
+        query = 'SELECT {} FROM books'.format(', '.join(BOOK_FIELDS))
+        conditions = []
+        params = []
+        if category_id is not None:
+            conditions.append(
+                'id IN (SELECT book_id FROM book_categories '
+                'WHERE category_id = ?)'
+            )
+            params.append(category_id)
+        if author is not None:
+            conditions.append('author = ?')
+            params.append(author)
+        if genre is not None:
+            conditions.append(
+                'id IN (SELECT book_id FROM book_genres WHERE genre = ?)'
+            )
+            params.append(genre)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id'
+
+        connection = sqlite3.connect(self.path)
+        try:
+            for row in connection.execute(query, params):
+                book = dict(zip(BOOK_FIELDS, row))
+                book['comments'] = json.loads(book['comments'])
+                book['genres'] = json.loads(book['genres'])
+                yield book
+        finally:
+            connection.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM books'
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def report(self) -> str:
+        """Сколько книг записано в базу.
+
+        :return: str - строка отчёта.
+        """
+        return 'В базу {} записано книг: {}, всего в базе: {}'.format(
+            self.path,
+            self.upserted,
+            self.count()
+        )
+
+
+store = None
+
+
+def enable(path: str) -> MetadataStore:
+    """Включает запись информации о книгах в базу.
+
+    :param path: путь до файла базы SQLite.
+
+    :return: MetadataStore - база книг.
+    """
+    global store
+    store = MetadataStore(path)
+    logger.info('База книг: %s', path)
+    return store
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+LABELS = {
+    'requests': 'status',
+    'retries': 'reason',
+    'queue_depth': 'queue',
+}
+
+
+class StageTimer:
+    """Контекстный менеджер, который добавляет время блока к стадии."""
+
+    __slots__ = ('metrics', 'stage', 'started_at')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.started_at = 0.0
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started_at
+        self.metrics.add_time(self.stage, elapsed)
+
+
+class Metrics:
+    """Счётчики, таймеры стадий и глубины очередей одного запуска.
+
+    Счётчики: запросы по кодам ответа, повторы, скаченные байты, книги.
+    Таймеры: суммарное время и количество вызовов стадий (network,
+    parse, disk_write). Глубины очередей: последнее и максимальное
+    значение. В конце запуска сохраняются в json или в текстовый
+    формат Prometheus.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda: [0.0, 0])
+        self.gauges = {}
+        self._lock = threading.Lock()
+        self._progress_stop = None
+
+    def add(self, name: str, value: int = 1, label=None):
+        with self._lock:
+            self.counters[name, label] += value
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            timer = self.timers[stage]
+            timer[0] += seconds
+            timer[1] += 1
+
+    def timer(self, stage: str) -> StageTimer:
+        return StageTimer(self, stage)
+
+    def observe(self, name: str, value: int, label=None):
+        with self._lock:
+            _, maximum = self.gauges.get((name, label), (0, 0))
+            self.gauges[name, label] = (value, max(value, maximum))
+
+    def get_total(self, name: str) -> int:
+        with self._lock:
+            return sum(
+                value for (counter_name, _), value in self.counters.items()
+                if counter_name == name
+            )
+
+    def summary(self) -> str:
+        """Строка о ходе работы: сколько скачано и с какой скоростью.
+
+        :return: str - строка отчёта.
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        books = self.get_total('books')
+        megabytes = self.get_total('bytes_downloaded') / 1024 / 1024
+        return (
+            'Книг: {} ({:.1f} в сек.), ошибок: {}, запросов: {}, '
+            'повторов: {}, скачано {:.1f} МБ ({:.2f} МБ/сек.)'.format(
+                books,
+                books / elapsed,
+                self.get_total('book_errors'),
+                self.get_total('requests'),
+                self.get_total('retries'),
+                megabytes,
+                megabytes / elapsed
+            )
+        )
+
+    def start_progress(self, interval: float):
+        """Раз в interval секунд пишет summary в лог из фонового потока.
+
+        :param interval: интервал в секундах.
+        """
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(interval):
+                logger.info(self.summary())
+
+        self._progress_stop = stop
+        threading.Thread(target=report, daemon=True).start()
+
+    def stop_progress(self):
+        if self._progress_stop is not None:
+            self._progress_stop.set()
+            self._progress_stop = None
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counters = defaultdict(dict)
+            for (name, label), value in self.counters.items():
+                counters[name]['' if label is None else str(label)] = value
+            gauges = defaultdict(dict)
+            for (name, label), (value, maximum) in self.gauges.items():
+                gauges[name][label or ''] = {'last': value, 'max': maximum}
+            return {
+                'run_seconds': time.monotonic() - self.started_at,
+                'counters': counters,
+                'stages': {
+                    stage: {'seconds': seconds, 'calls': calls}
+                    for stage, (seconds, calls) in self.timers.items()
+                },
+                'gauges': gauges,
+            }
+
+    def to_prometheus(self) -> str:
+        lines = [
+            '# TYPE tululu_run_seconds gauge',
+            'tululu_run_seconds {:.3f}'.format(
+                time.monotonic() - self.started_at
+            ),
+        ]
+        with self._lock:
+            counters = sorted(self.counters.items(), key=str)
+            timers = sorted(self.timers.items())
+            gauges = sorted(self.gauges.items(), key=str)
+
+        declared = set()
+        for (name, label), value in counters:
+            metric = 'tululu_{}_total'.format(name)
+            if metric not in declared:
+                declared.add(metric)
+                lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{}{} {}'.format(
+                metric,
+                format_labels(name, label),
+                value
+            ))
+
+        if timers:
+            lines.append('# TYPE tululu_stage_seconds_total counter')
+            lines.append('# TYPE tululu_stage_calls_total counter')
+        for stage, (seconds, calls) in timers:
+            lines.append(
+                'tululu_stage_seconds_total{{stage="{}"}} {:.6f}'.format(
+                    stage,
+                    seconds
+                )
+            )
+            lines.append(
+                'tululu_stage_calls_total{{stage="{}"}} {}'.format(
+                    stage,
+                    calls
+                )
+            )
+
+        for (name, label), (value, maximum) in gauges:
+            metric = 'tululu_{}'.format(name)
+            if metric not in declared:
+                declared.add(metric)
+                lines.append('# TYPE {} gauge'.format(metric))
+                lines.append('# TYPE {}_max gauge'.format(metric))
+            labels = format_labels(name, label)
+            lines.append('tululu_{}{} {}'.format(name, labels, value))
+            lines.append('tululu_{}_max{} {}'.format(name, labels, maximum))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str) -> str:
+        """Сохраняет метрики: .json - в json, иначе в формате Prometheus.
+
+        :param path: путь до файла.
+
+        :return: str - путь до файла.
+        """
+        if path.endswith('.json'):
+            content = json.dumps(self.to_dict(), indent=4)
+        else:
+            content = self.to_prometheus()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, mode='w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+        logger.info('Метрики сохранены в %s', path)
+        return path
+
+
+def format_labels(name: str, label) -> str:
+    if label is None:
+        return ''
+    return '{{{}="{}"}}'.format(LABELS.get(name, 'label'), label)
+
+
+metrics = None
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable() -> Metrics:
+    """Включает сбор метрик.
+
+    :return: Metrics - метрики запуска.
+    """
+    global metrics
+    metrics = Metrics()
+    return metrics
+
+
+def add(name: str, value: int = 1, label=None):
+    if metrics is not None:
+        metrics.add(name, value, label)
+
+
+def timer(stage: str):
+    """Таймер стадии, если метрики выключены - пустой контекст."""
+    if metrics is None:
+        return _NULL_TIMER
+    return metrics.timer(stage)
+
+
+def observe(name: str, value: int, label=None):
+    if metrics is not None:
+        metrics.observe(name, value, label)
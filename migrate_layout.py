@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+import storage
+
+from metadata_store import MetadataStore
+from services import configure_logging
+from services import save_books_as_json_file
+
+logger = logging.getLogger(__name__)
+
+SUBFOLDERS = ('books/', 'images/')
+VALIDATORS_FILENAME = 'downloaded_files_validators.json'
+
+
+def resolve_book_paths(book: dict) -> dict:
+    """Пути до файлов книги после переноса.
+
+    :param book: словарь с информацией о книге.
+
+    :return: dict - та же книга с поправленными путями.
+    """
+    for field in ('book_saved_path', 'poster_saved_path'):
+        book[field] = storage.resolve_saved_path(book.get(field, ''))
+    return book
+
+
+def migrate_json(json_path: str):
+    folder, filename = os.path.split(json_path)
+    with open(json_path, mode='r', encoding='utf-8') as file:
+        books = json.load(file)
+    save_books_as_json_file(
+        filename,
+        (resolve_book_paths(book) for book in books),
+        folder or './'
+    )
+
+
+def migrate_metadata_db(metadata_db: str):
+    book_store = MetadataStore(metadata_db)
+    try:
+        for book in list(book_store.iter_books()):
+            book_store.upsert(resolve_book_paths(book))
+    finally:
+        book_store.close()
+
+
+def migrate_validators(validators_path: str, moved: dict):
+    """Переносит валидаторы инкрементального режима на новые пути.
+
+    :param validators_path: json с валидаторами.
+    :param moved: старый путь -> новый путь.
+    """
+    moved = {
+        os.path.normpath(old_path): new_path
+        for old_path, new_path in moved.items()
+    }
+    with open(validators_path, mode='r', encoding='utf-8') as file:
+        validators = json.load(file)
+    validators = {
+        moved.get(os.path.normpath(path), path): validator
+        for path, validator in validators.items()
+    }
+    tmp_path = '{}.tmp'.format(validators_path)
+    with open(tmp_path, mode='w', encoding='utf-8') as file:
+        json.dump(validators, file, ensure_ascii=False)
+    os.replace(tmp_path, validators_path)
+
+
+def create_arg_parser():
+    description = 'Перекладываем скаченные книги и обложки в другую раскладку'
+    epilog = """
+    Пути в json и базе книг поправляются под новую раскладку
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=description,
+        epilog=epilog
+    )
+    arg_parser.add_argument('--dest_folder', default='./', metavar='',
+                            type=str,
+                            help='''путь до каталога с результатами
+                            парсинга. Значение по умолчанию ./ '''
+                            )
+
+    arg_parser.add_argument('--layout', default='sharded', metavar='',
+                            choices=storage.LAYOUTS,
+                            help='''в какую раскладку переложить файлы.
+                            Значение по умолчанию sharded '''
+                            )
+
+    arg_parser.add_argument('--shard_size', default=storage.SHARD_SIZE,
+                            metavar='', type=int,
+                            help='''сколько id книг в одной подпапке.
+                            Значение по умолчанию 1000 '''
+                            )
+
+    arg_parser.add_argument('--json_path', default='', metavar='', type=str,
+                            help='''json с информацией о книгах, в котором
+                            нужно поправить пути. По умолчанию не правим '''
+                            )
+
+    arg_parser.add_argument('--metadata_db', default='', metavar='',
+                            type=str,
+                            help='''база SQLite с информацией о книгах, в
+                            которой нужно поправить пути.
+                            По умолчанию не правим '''
+                            )
+
+    return arg_parser
+
+
+def main():
+    configure_logging()
+
+    parser = create_arg_parser()
+    args = parser.parse_args()
+    logger.debug('argparse %s', args)
+
+    for path in (args.json_path, args.metadata_db):
+        if path and not os.path.exists(path):
+            logger.critical('Нет файла %s', path)
+            raise KeyboardInterrupt
+
+    storage.set_layout(args.layout, args.shard_size)
+    moved = {}
+    for subfolder in SUBFOLDERS:
+        moved.update(storage.migrate_folder(
+            os.path.join(args.dest_folder, subfolder),
+            args.layout
+        ))
+
+    validators_path = os.path.join(args.dest_folder, VALIDATORS_FILENAME)
+    if moved and os.path.exists(validators_path):
+        migrate_validators(validators_path, moved)
+    if args.json_path:
+        migrate_json(args.json_path)
+    if args.metadata_db:
+        migrate_metadata_db(args.metadata_db)
+    logger.info('Раскладка %s, перенесено файлов: %s', args.layout, len(moved))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+
+    except KeyboardInterrupt:
+        logger.info('Работа скрипта остановлена')
+
+    finally:
+        sys.exit()
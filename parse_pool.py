@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import threading
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import parser
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SMALL_PAYLOAD = 8 * 1024
+
+
+def get_mp_context():
+    """Контекст multiprocessing для процессов пула.
+
+    fork многопоточного процесса (потоки скачивания, логирования,
+    прогресса) может оставить в процессе пула захваченную кем-то
+    блокировку, например логгера. forkserver запускает процессы из
+    отдельного однопоточного сервера, где его нет - spawn.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class ParsePool:
+    """Пул процессов для парсинга страниц книг.
+
+    BeautifulSoup работает под GIL, поэтому в потоках парсинг занимает
+    одно ядро. Пул отправляет html в отдельные процессы, маленькие
+    страницы (меньше small_payload символов или байтов) дешевле
+    распарсить на месте, чем передавать в другой процесс. Если процесс пула упал, пул
+    пересоздаётся, а страница парсится заново.
+    """
+
+    def __init__(self, workers: int, small_payload: int = SMALL_PAYLOAD):
+        """
+        :param workers: сколько процессов парсят страницы.
+        :param small_payload: страницы короче парсятся в текущем процессе.
+        """
+        self.workers = workers
+        self.small_payload = small_payload
+        self.backend = parser.backend
+        self.inline = 0
+        self.offloaded = 0
+        self.crashes = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_mp_context(),
+                    initializer=parser.set_backend,
+                    initargs=(self.backend,)
+                )
+            return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self.crashes += 1
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning('Процесс парсинга упал, пересоздаём пул')
+
+    def _is_small(self, html_content: str | bytes) -> bool:
+        small = len(html_content) < self.small_payload
+        with self._lock:
+            if small:
+                self.inline += 1
+            else:
+                self.offloaded += 1
+        return small
+
+    def parse_book_page(
+            self,
+            html_content: str | bytes,
+            encoding: str = parser.SITE_ENCODING
+    ) -> dict:
+        """Парсим страницу книги в пуле процессов.
+
+        Если процесс падает второй раз подряд, страница парсится в
+        текущем процессе.
+
+        :param html_content: html страницы книги (строка или байты).
+        :param encoding: кодировка, если html передан байтами.
+
+        :return: dict - данные по книге.
+        """
+        if self._is_small(html_content):
+            return parser.parse_book_page(html_content, encoding)
+
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(
+                    parser.parse_book_page,
+                    html_content,
+                    encoding
+                )
+                return future.result()
+            except BrokenProcessPool:
+                self._restart(executor)
+        return parser.parse_book_page(html_content, encoding)
+
+    async def async_parse_book_page(
+            self,
+            html_content: str | bytes,
+            encoding: str = parser.SITE_ENCODING
+    ) -> dict:
+        """То же что parse_book_page, но не блокирует event loop.
+
+        :param html_content: html страницы книги (строка или байты).
+        :param encoding: кодировка, если html передан байтами.
+
+        :return: dict - данные по книге.
+        """
+        if self._is_small(html_content):
+            return parser.parse_book_page(html_content, encoding)
+
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(
+                    parser.parse_book_page,
+                    html_content,
+                    encoding
+                )
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                self._restart(executor)
+        return parser.parse_book_page(html_content, encoding)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def report(self) -> str:
+        """Статистика пула.
+
+        :return: str - строка отчёта.
+        """
+        return (
+            'Пул парсинга: в процессах {}, на месте {}, падений {}'.format(
+                self.offloaded,
+                self.inline,
+                self.crashes
+            )
+        )
+
+
+pool = None
+
+
+def enable(workers: int) -> ParsePool:
+    """Включает парсинг страниц книг в пуле процессов.
+
+    Парсер (bs4 или lxml) берётся текущий, поэтому set_backend нужно
+    вызвать раньше. Пул создаётся сразу, поэтому включать его нужно до
+    запуска потоков скачивания.
+
+    :param workers: сколько процессов парсят страницы.
+
+    :return: ParsePool - пул парсинга.
+    """
+    global pool
+    pool = ParsePool(workers)
+    pool._get_executor()
+    logger.info('Парсим страницы в %s процессах', workers)
+    return pool
+
+
+def parse_book_page(
+        html_content: str | bytes,
+        encoding: str = parser.SITE_ENCODING
+) -> dict:
+    with metrics.timer('parse'):
+        if pool is None:
+            return parser.parse_book_page(html_content, encoding)
+        return pool.parse_book_page(html_content, encoding)
+
+
+async def async_parse_book_page(
+        html_content: str | bytes,
+        encoding: str = parser.SITE_ENCODING
+) -> dict:
+    with metrics.timer('parse'):
+        if pool is None:
+            return parser.parse_book_page(html_content, encoding)
+        return await pool.async_parse_book_page(html_content, encoding)
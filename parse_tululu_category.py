@@ -1,15 +1,34 @@
+import os
 import sys
+import asyncio
 import logging
+import aiohttp
 import requests
 import argparse
 
-from dataclasses import asdict
-
-from services import fetch_book
+import blob_store
+import http_client
+import incremental
+import response_cache
+import parse_pool
+import metadata_store
+import metrics
+import storage
+import scheduler
+
+from journal import BookJournal
+from parser import set_backend
+from pipeline import run_pipeline
 from services import configure_logging
-from services import get_category_end_page
+from services import start_log_queue
+from services import get_category_page
+from services import BooksJsonWriter
+from services import get_category_ids
 from services import save_books_as_json_file
-from services import get_book_ids_in_range_pages_in_category
+from services import iter_book_ids_in_range_pages_in_category
+from async_services import async_fetch_books
+from async_services import async_get_category_page
+from async_services import async_get_book_ids_in_range_pages_in_category
 
 
 logger = logging.getLogger(__name__)
@@ -26,11 +45,25 @@ def create_arg_parser():
         epilog=epilog
     )
 
-    arg_parser.add_argument('--category_id', default=55, metavar='', type=int,
-                            help='''id жанра(категории) откуда будем скачивать книги. 
+    arg_parser.add_argument('--category_id', default=[55], metavar='',
+                            type=int, nargs='+',
+                            help='''id жанра(категории) откуда будем скачивать книги, 
+                            можно указать несколько через пробел. 
                             Значение по умолчанию 55'''
                             )
 
+    arg_parser.add_argument('--all_categories', action='store_true',
+                            help='''Качать все категории сайта (список берётся 
+                            из меню главной страницы) вместо --category_id. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--json_per_category', action='store_true',
+                            help='''Сохранить отдельный json для каждой 
+                            категории вместо общего. 
+                                    Значение по умолчанию False '''
+                            )
+
     arg_parser.add_argument('--start_page', default=1, metavar='', type=int,
                             help='''номер страницы откуда начинаем скачивать. 
                             Значение по умолчанию 1 '''
@@ -62,9 +95,283 @@ def create_arg_parser():
                             Значение по умолчанию текущая папка скрипта '''
                             )
 
+    arg_parser.add_argument('--workers', default=1, metavar='', type=int,
+                            help='''сколько книг качаем параллельно. 
+                            Значение по умолчанию 1 '''
+                            )
+
+    arg_parser.add_argument('--page_workers', default=None, metavar='',
+                            type=int,
+                            help='''сколько страниц книг качаем и парсим 
+                            параллельно. Значение по умолчанию как --workers '''
+                            )
+
+    arg_parser.add_argument('--queue_size', default=100, metavar='',
+                            type=int,
+                            help='''сколько книг максимум одновременно 
+                            в обработке. Значение по умолчанию 100 '''
+                            )
+
+    arg_parser.add_argument('--engine', default='threads', metavar='',
+                            choices=['threads', 'async'],
+                            help='''как качаем: threads - пул потоков, 
+                            async - asyncio/aiohttp. 
+                            Значение по умолчанию threads '''
+                            )
+
+    arg_parser.add_argument('--parser', default='bs4', metavar='',
+                            choices=['bs4', 'lxml'],
+                            help='''чем парсим страницы: bs4 - BeautifulSoup, 
+                            lxml - быстрый парсер на lxml. 
+                            Значение по умолчанию bs4 '''
+                            )
+
+    arg_parser.add_argument('--parse_workers', default=0, metavar='',
+                            type=int,
+                            help='''сколько процессов парсят страницы книг, 
+                            0 - парсим в основном процессе. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--timeout', default=30, metavar='', type=float,
+                            help='''таймаут ожидания ответа сайта в секундах. 
+                            Значение по умолчанию 30 '''
+                            )
+
+    arg_parser.add_argument('--max_per_host', default=10, metavar='',
+                            type=int,
+                            help='''сколько соединений максимум держим к сайту. 
+                            Значение по умолчанию 10 '''
+                            )
+
+    arg_parser.add_argument('--rps', default=10, metavar='', type=float,
+                            help='''максимум запросов к сайту в секунду, 
+                            0 - без ограничения. При ответах 429/5xx скорость 
+                            снижается автоматически. 
+                            Значение по умолчанию 10 '''
+                            )
+
+    arg_parser.add_argument('--max_attempts', default=5, metavar='', type=int,
+                            help='''сколько раз пробуем запрос при ошибках 
+                            соединения и ответах 429/5xx. 
+                            Значение по умолчанию 5 '''
+                            )
+
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='''Продолжить прерванное скачивание: книги 
+                            из журнала downloaded_books_journal.jsonl 
+                            не качаются повторно. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='''Не перекачивать и не перезаписывать 
+                            файлы, которые не поменялись с прошлого запуска. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--poster_cache', default='', metavar='',
+                            type=str,
+                            help='''папка общего хранилища обложек: одинаковые 
+                            обложки хранятся один раз, уже скаченные не 
+                            качаются повторно. По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--page_cache', default='', metavar='', type=str,
+                            help='''файл SQLite для кэша страниц книг и 
+                            категорий. По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--page_cache_size', default=512, metavar='',
+                            type=int,
+                            help='''сколько мегабайт максимум занимает кэш 
+                            страниц. Значение по умолчанию 512 '''
+                            )
+
+    arg_parser.add_argument('--offline', action='store_true',
+                            help='''Не ходить на сайт: страницы берутся только 
+                            из --page_cache, тексты и обложки не качаются. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--metadata_db', default='', metavar='',
+                            type=str,
+                            help='''файл SQLite, куда добавляется информация 
+                            о скаченных книгах из всех запусков и категорий. 
+                            По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--metrics', default='', metavar='', type=str,
+                            help='''куда сохранить метрики запуска: файл .json 
+                            или текстовый формат Prometheus для остальных 
+                            имён. По умолчанию не сохраняются '''
+                            )
+
+    arg_parser.add_argument('--progress', default=0, metavar='', type=float,
+                            help='''раз в сколько секунд писать в лог сколько 
+                            скачано и с какой скоростью, 0 - не писать. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--fast_logging', action='store_true',
+                            help='''Писать логи из отдельного потока через 
+                            очередь, чтобы запись логов не тормозила 
+                            скачивание. Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--compress', default='none', metavar='',
+                            choices=storage.COMPRESSIONS,
+                            help='''как хранить тексты книг: none - как есть, 
+                            gzip - сжатыми в файлы .txt.gz. 
+                            Значение по умолчанию none '''
+                            )
+
+    arg_parser.add_argument('--layout', default='flat', metavar='',
+                            choices=storage.LAYOUTS,
+                            help='''как раскладывать книги и обложки: 
+                            flat - в одну папку, sharded - по подпапкам 
+                            id // shard_size. Значение по умолчанию flat '''
+                            )
+
+    arg_parser.add_argument('--shard_size', default=storage.SHARD_SIZE,
+                            metavar='', type=int,
+                            help='''сколько id книг попадает в одну подпапку 
+                            при --layout sharded. 
+                            Значение по умолчанию 1000 '''
+                            )
+
+    arg_parser.add_argument('--bandwidth', default=0, metavar='', type=int,
+                            help='''сколько килобайт в секунду качаем всего, 
+                            0 - без ограничения. Полоса отдаётся сначала 
+                            страницам книг, потом обложкам, потом текстам. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--page_slots', default=0, metavar='', type=int,
+                            help='''сколько страниц книг и категорий качаем 
+                            одновременно, 0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--poster_slots', default=0, metavar='',
+                            type=int,
+                            help='''сколько обложек качаем одновременно, 
+                            0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--txt_slots', default=0, metavar='', type=int,
+                            help='''сколько текстов книг качаем одновременно, 
+                            0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
     return arg_parser
 
 
+def get_category_book_ids(
+        category_id: int,
+        start_page: int,
+        end_page: int,
+        use_async: bool,
+        workers: int,
+        several_categories: bool
+):
+    """id книг на страницах категории с start_page по end_page.
+
+    :param category_id: id категории.
+    :param start_page: страница, с которой начинаем.
+    :param end_page: страница, до которой качаем (включительно), если
+        меньше start_page - до последней страницы категории.
+    :param use_async: качать страницы через aiohttp.
+    :param workers: сколько страниц качаем параллельно (для aiohttp).
+    :param several_categories: качаем несколько категорий - лишние
+        страницы обрезаются, а не останавливают скрипт.
+
+    :return: список (или генератор) id книг.
+    """
+    if use_async:
+        category_end_page_on_site, first_page_book_ids = asyncio.run(
+            async_get_category_page(category_id)
+        )
+    else:
+        category_end_page_on_site, first_page_book_ids = get_category_page(
+            category_id
+        )
+    fetched_pages = {1: first_page_book_ids}
+    logger.debug(
+        'Страниц %s у выбранной категории %s',
+        category_end_page_on_site,
+        category_id
+    )
+
+    if start_page > end_page:
+        end_page = category_end_page_on_site
+
+    if end_page > category_end_page_on_site:
+        if not several_categories:
+            logger.critical(
+                'Страниц у выбранной категории %s \n'
+                'Поменяйте диапазон для скачивания',
+                category_end_page_on_site,
+            )
+            raise KeyboardInterrupt
+        end_page = category_end_page_on_site
+
+    if use_async:
+        return asyncio.run(
+            async_get_book_ids_in_range_pages_in_category(
+                category_id,
+                start_page,
+                end_page + 1,
+                workers,
+                fetched_pages
+            )
+        )
+    return iter_book_ids_in_range_pages_in_category(
+        category_id,
+        start_page,
+        end_page + 1,
+        fetched_pages
+    )
+
+
+def save_books_by_category(
+        books,
+        book_categories: dict,
+        json_path: str
+) -> list[str]:
+    """Сохраняет книги в отдельный json для каждой категории.
+
+    Книги читаются один раз, книга из нескольких категорий попадает
+    в файл каждой из них.
+
+    :param books: итератор словарей с информацией о книгах.
+    :param book_categories: id книги -> список id категорий.
+    :param json_path: путь до каталога куда сохраняем файлы.
+
+    :return: list - пути до сохранённых файлов.
+    """
+    os.makedirs(json_path, exist_ok=True)
+    writers = {}
+    try:
+        for book in books:
+            for category_id in book_categories.get(book['id'], []):
+                writer = writers.get(category_id)
+                if writer is None:
+                    writer = BooksJsonWriter(os.path.join(
+                        json_path,
+                        'downloaded_books_info_{}.json'.format(category_id)
+                    ))
+                    writers[category_id] = writer
+                writer.write(book)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    logger.info('Сохранено файлов по категориям: %s', len(writers))
+    return [writer.path for writer in writers.values()]
+
+
 def main():
     configure_logging()
 
@@ -73,71 +380,223 @@ def main():
     parser = create_arg_parser()
     args = parser.parse_args()
     logger.debug('argparse %s', args)
+    if args.fast_logging:
+        start_log_queue()
+    storage.set_compression(args.compress)
+    storage.set_layout(args.layout, args.shard_size)
+
+    http_client.configure(
+        read_timeout=args.timeout,
+        max_per_host=args.max_per_host,
+        max_rps=args.rps,
+        max_attempts=args.max_attempts
+    )
+    set_backend(args.parser)
+    book_parse_pool = None
+    if args.parse_workers > 0:
+        book_parse_pool = parse_pool.enable(args.parse_workers)
 
-    category_id = args.category_id
     category_start_page = args.start_page
     category_end_page = args.end_page
     dest_folder = args.dest_folder
-    skip_imgs = args.skip_imgs
-    skip_txt = args.skip_txt
+    skip_imgs = args.skip_imgs or args.offline
+    skip_txt = args.skip_txt or args.offline
     json_path = args.json_path
 
-    category_end_page_on_site = get_category_end_page(category_id)
-    logger.debug(
-        'Страниц %s у выбранной категории %s',
-        category_end_page_on_site,
-        category_id
-    )
+    run_metrics = None
+    if args.metrics or args.progress:
+        run_metrics = metrics.enable()
+        if args.progress:
+            run_metrics.start_progress(args.progress)
 
-    if category_end_page > category_end_page_on_site:
-        logger.critical(
-            'Страниц у выбранной категории %s \n'
-            'Поменяйте диапазон для скачивания',
-            category_end_page_on_site,
+    validator_store = None
+    if args.incremental:
+        validator_store = incremental.enable(
+            os.path.join(dest_folder, 'downloaded_files_validators.json')
+        )
 
+    page_cache = None
+    if args.page_cache or args.offline:
+        page_cache = response_cache.enable(
+            args.page_cache or 'page_cache.sqlite3',
+            max_size=args.page_cache_size * 1024 * 1024,
+            offline=args.offline
         )
-        raise KeyboardInterrupt
 
-    if category_start_page > category_end_page:
-        category_end_page = category_end_page_on_site
+    poster_store = None
+    if args.poster_cache:
+        poster_store = blob_store.enable(args.poster_cache)
+
+    book_store = None
+    if args.metadata_db:
+        book_store = metadata_store.enable(args.metadata_db)
+
+    download_scheduler = None
+    if args.bandwidth or args.page_slots or args.poster_slots \
+            or args.txt_slots:
+        download_scheduler = scheduler.enable(
+            args.bandwidth * 1024,
+            {
+                'page': args.page_slots,
+                'poster': args.poster_slots,
+                'txt': args.txt_slots,
+            }
+        )
 
-    book_ids = get_book_ids_in_range_pages_in_category(
-        category_id,
-        category_start_page,
-        category_end_page + 1
-    )
+    use_async = args.engine == 'async'
+
+    if args.all_categories:
+        category_ids = get_category_ids()
+    else:
+        category_ids = list(dict.fromkeys(args.category_id))
+    if not category_ids:
+        logger.critical('Не нашел категорий для скачивания')
+        raise KeyboardInterrupt
+    several_categories = len(category_ids) > 1
+
+    book_categories = {}
+
+    def list_category(category_id):
+        logger.info('Собираем id книг категории %s', category_id)
+        return get_category_book_ids(
+            category_id,
+            category_start_page,
+            category_end_page,
+            use_async,
+            args.workers,
+            several_categories
+        )
+
+    def iter_listed_book_ids(first_category_book_ids):
+        for category_id in category_ids:
+            if category_id == category_ids[0]:
+                category_book_ids = first_category_book_ids
+            else:
+                try:
+                    category_book_ids = list_category(category_id)
+                except (requests.RequestException, aiohttp.ClientError):
+                    logger.warning(
+                        'Не удалось получить страницы категории %s',
+                        category_id
+                    )
+                    continue
+            for book_id in category_book_ids:
+                found_in = book_categories.setdefault(book_id, [])
+                if category_id in found_in:
+                    continue
+                found_in.append(category_id)
+                if len(found_in) == 1:
+                    yield book_id
+
+    book_ids = iter_listed_book_ids(list_category(category_ids[0]))
+    if use_async:
+        book_ids = list(book_ids)
+
+    listed_book_ids = set()
+    journal_path = os.path.join(json_path, 'downloaded_books_journal.jsonl')
+    with BookJournal(journal_path, resume=args.resume) as journal:
+        journaled_book_ids = journal.load_ids()
+
+        def get_book_ids_to_fetch():
+            for book_id in book_ids:
+                listed_book_ids.add(book_id)
+                if book_id not in journaled_book_ids:
+                    yield book_id
+
+        def journal_book(book):
+            book.download_link = f'{book.download_link}?id={book.id}'
+            journal.append(book)
+            if book_store is not None:
+                book_store.upsert(book, book_categories[book.id])
+            journaled_book_ids.add(book.id)
+
+        if use_async:
+            asyncio.run(
+                async_fetch_books(
+                    get_book_ids_to_fetch(),
+                    dest_folder,
+                    skip_imgs,
+                    skip_txt,
+                    args.workers,
+                    journal_book
+                )
+            )
+        else:
+            run_pipeline(
+                get_book_ids_to_fetch(),
+                dest_folder,
+                skip_imgs,
+                skip_txt,
+                args.page_workers or args.workers,
+                args.workers,
+                args.queue_size,
+                journal_book
+            )
 
-    if not book_ids:
+    if not listed_book_ids:
         logger.critical(
             'Не нашел книг для скачивания. Проверьте диапазон страниц'
         )
         raise KeyboardInterrupt
 
-    books = []
-    for book_id in book_ids:
-        try:
-            book = fetch_book(book_id, dest_folder, skip_imgs, skip_txt)
-            book.download_link = f'{book.download_link}?id={book.id}'
-            books.append(asdict(book))
-        except requests.HTTPError:
-            logger.error(
-                'Не удалось скачать книгу или обложку. id - %s',
-                book_id
-            )
+    if several_categories:
+        logger.info(
+            'Найдено книг: %s, из них в нескольких категориях: %s',
+            len(book_categories),
+            sum(len(found_in) > 1 for found_in in book_categories.values())
+        )
 
-    if books:
-        save_books_as_json_file(
-            'downloaded_books_info.json',
-            books,
-            json_path,
+    if book_store is not None:
+        book_store.add_categories(book_categories)
+
+    if listed_book_ids & journaled_book_ids:
+        books = (
+            {**book, 'categories': book_categories[book['id']]}
+            for book in journal.iter_books()
+            if book['id'] in listed_book_ids
         )
+        if args.json_per_category:
+            save_books_by_category(books, book_categories, json_path)
+        else:
+            save_books_as_json_file(
+                'downloaded_books_info.json',
+                books,
+                json_path,
+            )
+
+    if validator_store is not None:
+        logger.info(validator_store.report())
+
+    if poster_store is not None:
+        logger.info(poster_store.report())
+
+    if page_cache is not None:
+        logger.info(page_cache.report())
+        page_cache.close()
+
+    if book_store is not None:
+        logger.info(book_store.report())
+        book_store.close()
+
+    if book_parse_pool is not None:
+        book_parse_pool.shutdown()
+        logger.info(book_parse_pool.report())
+
+    if download_scheduler is not None:
+        logger.info(download_scheduler.report())
+
+    if run_metrics is not None:
+        run_metrics.stop_progress()
+        logger.info(run_metrics.summary())
+        if args.metrics:
+            run_metrics.save(args.metrics)
 
 
 if __name__ == '__main__':
     try:
         main()
 
-    except requests.HTTPError:
+    except (requests.RequestException, aiohttp.ClientError):
         logger.critical(
             'Не смог определить количество доступных страниц категории'
         )
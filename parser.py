@@ -3,19 +3,71 @@ import logging
 
 from bs4 import BeautifulSoup
 
+import fast_parser
+
 
 logger = logging.getLogger(__name__)
 
+BACKENDS = ('bs4', 'lxml')
+backend = 'bs4'
+
+SITE_ENCODING = 'windows-1251'
+
+
+def set_backend(name: str):
+    """Выбираем чем парсим страницы.
+
+    bs4 - BeautifulSoup с CSS селекторами,
+    lxml - lxml.html с заранее скомпилированными XPath (быстрее).
+
+    :param name: название парсера из BACKENDS.
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError('Неизвестный парсер {}'.format(name))
+    backend = name
+    logger.debug('Парсер: %s', backend)
 
-def parse_book_page(html_content: str) -> dict:
+
+def make_soup(
+        html_content: str | bytes,
+        encoding: str | None = None
+) -> BeautifulSoup:
+    """Разбираем html через BeautifulSoup.
+
+    Байты декодируются один раз известной кодировкой: BeautifulSoup
+    не угадывает её по содержимому страницы, а from_encoding у него
+    медленнее, чем готовая строка.
+
+    :param html_content: html страницы (строка или байты ответа).
+    :param encoding: кодировка байтов.
+
+    :return: BeautifulSoup - разобранная страница.
+    """
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode(
+            encoding or SITE_ENCODING,
+            errors='replace'
+        )
+    return BeautifulSoup(html_content, 'lxml')
+
+
+def parse_book_page(
+        html_content: str | bytes,
+        encoding: str = SITE_ENCODING
+) -> dict:
     """Парсим информацию по книге с сайта tululu.org.
 
     :param html_content: html страницы книги.
+    :param encoding: кодировка, если html передан байтами.
 
     :return: dict - данные по книге.
     """
-    logger.info('Парсим информацию о книге')
-    soup = BeautifulSoup(html_content, 'lxml')
+    if backend == 'lxml':
+        return fast_parser.parse_book_page(html_content, encoding)
+
+    logger.debug('Парсим информацию о книге')
+    soup = make_soup(html_content, encoding)
 
     title_tag = soup.select_one('#content h1')
     split_title_tag = title_tag.text.split('::')
@@ -39,23 +91,112 @@ def parse_book_page(html_content: str) -> dict:
         'poster_link': book_poster_link
     }
 
-    logger.debug('Полученная информация о книге: %s', book)
-    logger.info('Завершено')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            'Полученная информация о книге: %s :: %s, жанры %s, '
+            'комментариев %s',
+            book['title'],
+            book['author'],
+            book['genres'],
+            len(book['comments'])
+        )
+    logger.debug('Завершено')
 
     return book
 
 
-def parse_category_page(html_content: str) -> list[int]:
+def parse_category_page(
+        html_content: str | bytes,
+        encoding: str = SITE_ENCODING
+) -> list[int]:
     """Парсим страницу с книгами по категории сайта tululu.org.
 
     :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
 
     :return: list - список id книг из категории.
     """
-    logger.info('Парсим информацию о книгах со страницы категории')
-    book_ids = []
+    if backend == 'lxml':
+        return fast_parser.parse_category_page(html_content, encoding)
+
+    logger.debug('Парсим информацию о книгах со страницы категории')
+    soup = make_soup(html_content, encoding)
+    book_ids = find_book_ids(soup)
+    logger.debug('Завершено')
+
+    return book_ids
+
+
+def get_number_of_pages_in_category(
+        html_content: str | bytes,
+        encoding: str = SITE_ENCODING
+) -> int:
+    """Получаем информацию о количестве страниц категории книг сайта tululu.org.
+
+    :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: int - количество страниц категории книг.
+    """
+    if backend == 'lxml':
+        return fast_parser.get_number_of_pages_in_category(html_content, encoding)
 
-    soup = BeautifulSoup(html_content, 'lxml')
+    logger.debug('Получаем информацию о количестве страниц категории книг')
+    soup = make_soup(html_content, encoding)
+    return find_number_of_pages(soup)
+
+
+def parse_category_listing(
+        html_content: str | bytes,
+        encoding: str = SITE_ENCODING
+) -> tuple[int, list[int]]:
+    """Парсим страницу категории один раз: количество страниц и id книг.
+
+    :param html_content: html страницы с категорией.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: tuple(количество страниц категории, список id книг на странице).
+    """
+    if backend == 'lxml':
+        return fast_parser.parse_category_listing(html_content, encoding)
+
+    logger.debug('Парсим страницу категории')
+    soup = make_soup(html_content, encoding)
+    return find_number_of_pages(soup), find_book_ids(soup)
+
+
+def parse_category_ids(
+        html_content: str | bytes,
+        encoding: str = SITE_ENCODING
+) -> list[int]:
+    """Ищем id всех категорий (жанров) в ссылках вида /l55/.
+
+    :param html_content: html страницы сайта с меню жанров.
+    :param encoding: кодировка, если html передан байтами.
+
+    :return: list - id категорий по возрастанию.
+    """
+    if backend == 'lxml':
+        return fast_parser.parse_category_ids(html_content, encoding)
+
+    logger.debug('Ищем категории на странице')
+    soup = make_soup(html_content, encoding)
+    category_ids = set()
+    for link in soup.select('a[href]'):
+        match = fast_parser.CATEGORY_LINK.search(link['href'].strip())
+        if match:
+            category_ids.add(int(match.group(1)))
+    return sorted(category_ids)
+
+
+def find_book_ids(soup: BeautifulSoup) -> list[int]:
+    """Ищем id книг в разобранной странице категории.
+
+    :param soup: разобранная страница категории.
+
+    :return: list - список id книг из категории.
+    """
+    book_ids = []
     tables_with_book_description = soup.select('table.d_book')
     for table in tables_with_book_description:
         table_row_with_book_link = table.select_one(':link')
@@ -65,23 +206,18 @@ def parse_category_page(html_content: str) -> list[int]:
         book_ids.append(int(book_id))
 
     logger.debug('Cписок id найденный книг %s', book_ids)
-    logger.info('Завершено')
-
     return book_ids
 
 
-def get_number_of_pages_in_category(html_content: str) -> int:
-    """Получаем информацию о количестве страниц категории книг сайта tululu.org.
+def find_number_of_pages(soup: BeautifulSoup) -> int:
+    """Ищем количество страниц в разобранной странице категории.
 
-    :param html_content: html страницы с категорией.
+    :param soup: разобранная страница категории.
 
     :return: int - количество страниц категории книг.
     """
-
-    logger.info('Получаем информацию о количестве страниц категории книг')
     count_pages = 1
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
         count_pages = soup.select_one('.npage:last-of-type').text
         logger.debug('Количество страниц: %s', count_pages)
         return int(count_pages)
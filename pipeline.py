@@ -0,0 +1,162 @@
+import queue
+import logging
+import threading
+
+import requests
+
+import metrics
+
+from services import get_book
+from services import download_book_files
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def _log_fetch_error(book_id: int, error: Exception):
+    metrics.add('book_errors')
+    if isinstance(error, requests.RequestException):
+        logger.error('Не удалось скачать книгу или обложку. id - %s', book_id)
+    else:
+        logger.exception(
+            'Ошибка при скачивании книги. id - %s',
+            book_id,
+            exc_info=error
+        )
+
+
+def run_pipeline(
+        book_ids,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False,
+        page_workers: int = 1,
+        download_workers: int = 1,
+        queue_size: int = 100,
+        on_book=None
+) -> int:
+    """Качает книги потоковым конвейером.
+
+    Стадии конвейера работают одновременно и связаны очередями:
+    получение id книг (book_ids может быть генератором, который листает
+    страницы категории) -> загрузка и парсинг страницы книги ->
+    скачивание текста и обложки -> on_book. Одновременно в конвейере
+    не больше queue_size книг, поэтому память не растёт с количеством
+    страниц. on_book вызывается в порядке book_ids, книги которые не
+    удалось скачать пропускаются.
+
+    :param book_ids: ID книг для скачивания.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+    :param page_workers: сколько страниц книг качаем одновременно.
+    :param download_workers: сколько книг (текст и обложку) качаем
+        одновременно.
+    :param queue_size: сколько книг максимум одновременно в конвейере.
+    :param on_book: функция, которую вызываем с каждой скаченной книгой.
+
+    :return: int - сколько книг скачано.
+    """
+    logger.info(
+        'Конвейер: страниц %s, скачиваний %s, очередь %s',
+        page_workers,
+        download_workers,
+        queue_size
+    )
+    in_flight = threading.BoundedSemaphore(queue_size)
+    page_queue = queue.Queue(queue_size)
+    download_queue = queue.Queue(queue_size)
+    output_queue = queue.Queue()
+    errors = []
+
+    def list_book_ids():
+        try:
+            for seq, book_id in enumerate(book_ids):
+                in_flight.acquire()
+                page_queue.put((seq, book_id))
+                metrics.observe('queue_depth', page_queue.qsize(), 'pages')
+        except Exception as error:
+            errors.append(error)
+        finally:
+            for _ in range(page_workers):
+                page_queue.put(_DONE)
+
+    def fetch_pages():
+        while (item := page_queue.get()) is not _DONE:
+            seq, book_id = item
+            try:
+                book = get_book(book_id)
+                download_queue.put((seq, book))
+                metrics.observe(
+                    'queue_depth',
+                    download_queue.qsize(),
+                    'downloads'
+                )
+            except Exception as error:
+                _log_fetch_error(book_id, error)
+                output_queue.put((seq, None))
+
+    def download_files():
+        while (item := download_queue.get()) is not _DONE:
+            seq, book = item
+            try:
+                download_book_files(book, dest_folder, skip_imgs, skip_txt)
+                output_queue.put((seq, book))
+            except Exception as error:
+                _log_fetch_error(book.id, error)
+                output_queue.put((seq, None))
+
+    def close_stages(page_threads, download_threads):
+        for thread in page_threads:
+            thread.join()
+        for _ in download_threads:
+            download_queue.put(_DONE)
+        for thread in download_threads:
+            thread.join()
+        output_queue.put(_DONE)
+
+    page_threads = [
+        threading.Thread(target=fetch_pages, daemon=True)
+        for _ in range(page_workers)
+    ]
+    download_threads = [
+        threading.Thread(target=download_files, daemon=True)
+        for _ in range(download_workers)
+    ]
+    threads = [
+        threading.Thread(target=list_book_ids, daemon=True),
+        *page_threads,
+        *download_threads,
+        threading.Thread(
+            target=close_stages,
+            args=(page_threads, download_threads),
+            daemon=True
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+
+    books_count = 0
+    pending = {}
+    next_seq = 0
+    while (item := output_queue.get()) is not _DONE:
+        seq, book = item
+        pending[seq] = book
+        metrics.observe('queue_depth', len(pending), 'reorder')
+        while next_seq in pending:
+            book = pending.pop(next_seq)
+            next_seq += 1
+            in_flight.release()
+            if book is None:
+                continue
+            books_count += 1
+            metrics.add('books')
+            if on_book is not None:
+                on_book(book)
+
+    if errors:
+        raise errors[0]
+
+    logger.info('Скачано книг: %s', books_count)
+    return books_count
@@ -0,0 +1,144 @@
+import time
+import random
+import logging
+import threading
+
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class AdaptiveRateLimiter:
+    """Ограничитель запросов в секунду (token bucket) с подстройкой.
+
+    Если среди последних ответов много 429/5xx, скорость уменьшается
+    вдвое (не чаще раза в cooldown секунд), каждый успешный ответ понемногу
+    возвращает её к max_rps. rate=0 - без ограничения.
+    """
+
+    def __init__(
+            self,
+            max_rps: float,
+            min_rps: float = 0.5,
+            window: int = 50,
+            error_threshold: float = 0.1,
+            cooldown: float = 5
+    ):
+        """
+        :param max_rps: максимум запросов в секунду, 0 - без ограничения.
+        :param min_rps: ниже этой скорости не замедляемся.
+        :param window: по скольки последним ответам считаем долю ошибок.
+        :param error_threshold: при какой доле 429/5xx замедляемся.
+        :param cooldown: сколько секунд не замедляемся повторно.
+        """
+        self.max_rps = max_rps
+        self.min_rps = min(min_rps, max_rps) if max_rps else 0
+        self.rate = max_rps
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._slowed_down_at = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Занимает место под запрос.
+
+        :return: float - сколько секунд подождать перед запросом.
+        """
+        with self._lock:
+            now = time.monotonic()
+            pause = max(self._paused_until - now, 0)
+            if not self.rate:
+                return pause
+
+            self._tokens = min(
+                self._tokens + (now - self._updated_at) * self.rate,
+                max(self.rate, 1)
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            return max(wait, pause)
+
+    def acquire(self):
+        """Ждёт своей очереди на запрос."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Останавливает все запросы на seconds секунд (Retry-After)."""
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until,
+                time.monotonic() + seconds
+            )
+
+    def on_response(self, status: int):
+        """Учитывает ответ сайта и подстраивает скорость.
+
+        :param status: код ответа.
+        """
+        throttled = status in RETRY_STATUSES
+        with self._lock:
+            self._outcomes.append(throttled)
+            if not self.rate:
+                return
+
+            if not throttled:
+                step = self.max_rps / 100
+                self.rate = min(self.max_rps, self.rate + step)
+                return
+
+            errors_share = sum(self._outcomes) / len(self._outcomes)
+            now = time.monotonic()
+            if errors_share < self.error_threshold:
+                return
+            if now - self._slowed_down_at < self.cooldown:
+                return
+            self._slowed_down_at = now
+            self.rate = max(self.min_rps, self.rate / 2)
+        logger.warning(
+            'Сайт отвечает ошибками (%s%%), снижаю скорость до %.2f '
+            'запросов в секунду',
+            round(errors_share * 100),
+            self.rate
+        )
+
+
+def get_backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Экспоненциальная задержка перед повтором со случайным разбросом.
+
+    :param attempt: номер неудачной попытки (с 1).
+    :param base: задержка после первой попытки.
+    :param maximum: максимальная задержка.
+
+    :return: float - сколько секунд ждать.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Разбирает заголовок Retry-After (секунды или HTTP дата).
+
+    :param value: значение заголовка.
+
+    :return: float - сколько секунд ждать или None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
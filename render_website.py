@@ -0,0 +1,397 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+
+from jinja2 import Environment
+from jinja2 import FileSystemLoader
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import select_autoescape
+
+from storage import AtomicFileWriter
+from metadata_store import MetadataStore
+from services import configure_logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.render_manifest.json'
+BYTECODE_CACHE_FOLDER = '.jinja_cache'
+BATCH_SIZE = 500
+
+environment = None
+
+
+def create_environment(
+        templates_folder: str,
+        cache_folder: str | None = None
+) -> Environment:
+    """Окружение jinja2, которое компилирует каждый шаблон один раз.
+
+    Скомпилированные шаблоны хранятся в памяти процесса, а с
+    cache_folder ещё и на диске, чтобы новые процессы пула их не
+    компилировали заново.
+
+    :param templates_folder: папка с шаблонами.
+    :param cache_folder: папка для скомпилированных шаблонов.
+
+    :return: Environment - окружение jinja2.
+    """
+    bytecode_cache = None
+    if cache_folder:
+        os.makedirs(cache_folder, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(cache_folder)
+    return Environment(
+        loader=FileSystemLoader(templates_folder),
+        autoescape=select_autoescape(['html']),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False
+    )
+
+
+def init_environment(templates_folder: str, cache_folder: str | None):
+    global environment
+    environment = create_environment(templates_folder, cache_folder)
+
+
+def render_pages(jobs: list[tuple]) -> int:
+    """Рендерит страницы и атомарно сохраняет их на диск.
+
+    :param jobs: список (путь до страницы, имя шаблона, контекст).
+
+    :return: int - сколько страниц сохранено.
+    """
+    for page_path, template_name, context in jobs:
+        html = environment.get_template(template_name).render(context)
+        folder, filename = os.path.split(page_path)
+        with AtomicFileWriter(folder, filename) as writer:
+            writer.write(html.encode('utf-8'))
+            writer.commit()
+    return len(jobs)
+
+
+def get_templates_hash(templates_folder: str) -> str:
+    """Хэш всех шаблонов: если шаблон поменялся, страницы рендерятся заново.
+
+    :param templates_folder: папка с шаблонами.
+
+    :return: str - sha256 шаблонов.
+    """
+    templates_hash = hashlib.sha256()
+    for root, _, filenames in sorted(os.walk(templates_folder)):
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            templates_hash.update(path.encode('utf-8'))
+            with open(path, mode='rb') as file:
+                templates_hash.update(file.read())
+    return templates_hash.hexdigest()
+
+
+def get_file_url(path: str) -> str:
+    """Ссылка на скаченный файл относительно текущей папки.
+
+    :param path: путь до файла или ссылка на сайт.
+
+    :return: str - ссылка для html, пустая строка если файла нет.
+    """
+    if not path or '://' in path:
+        return path or ''
+    if os.path.isabs(path):
+        path = os.path.relpath(path)
+    return quote(os.path.normpath(path).replace(os.sep, '/'))
+
+
+def get_folder_prefix(page_folder: str) -> str:
+    """Путь из папки страницы до текущей папки, например ../../"""
+    prefix = os.path.relpath(os.curdir, page_folder).replace(os.sep, '/')
+    return '' if prefix == os.curdir else prefix + '/'
+
+
+def add_prefix(prefix: str, url: str) -> str:
+    if not url or '://' in url:
+        return url
+    return prefix + url
+
+
+def get_page_name(page: int) -> str:
+    return 'index{}.html'.format(page)
+
+
+def get_book_context(
+        book: dict,
+        prefix: str,
+        file_urls: tuple[str, str],
+        page_url: str
+) -> dict:
+    poster_url, book_url = file_urls
+    return {
+        'id': book['id'],
+        'title': book['title'],
+        'author': book['author'],
+        'genres': list(book['genres']),
+        'comments': list(book['comments']),
+        'poster_url': add_prefix(prefix, poster_url),
+        'book_url': add_prefix(prefix, book_url),
+        'page_url': page_url,
+    }
+
+
+def iter_page_jobs(books: list[dict], site_folder: str, books_per_page: int):
+    """Страницы каталога: постраничный список книг и страница каждой книги.
+
+    :param books: список словарей с информацией о книгах.
+    :param site_folder: папка сайта.
+    :param books_per_page: сколько книг на странице списка.
+
+    :return: генератор (путь до страницы, имя шаблона, контекст).
+    """
+    books_folder = os.path.join(site_folder, 'books')
+    site_prefix = get_folder_prefix(site_folder)
+    books_prefix = get_folder_prefix(books_folder)
+    pages_count = max((len(books) + books_per_page - 1) // books_per_page, 1)
+    for page in range(1, pages_count + 1):
+        page_books = books[(page - 1) * books_per_page:page * books_per_page]
+        index_context = {
+            'page': page,
+            'pages_count': pages_count,
+            'books': [],
+        }
+        for book in page_books:
+            book_page_name = '{}.html'.format(book['id'])
+            file_urls = (
+                get_file_url(book['poster_saved_path']),
+                get_file_url(book['book_saved_path']),
+            )
+            index_context['books'].append(get_book_context(
+                book,
+                site_prefix,
+                file_urls,
+                'books/{}'.format(book_page_name)
+            ))
+            yield (
+                os.path.join(books_folder, book_page_name),
+                'book.html',
+                {
+                    'book': get_book_context(
+                        book,
+                        books_prefix,
+                        file_urls,
+                        book_page_name
+                    ),
+                    'index_url': '../{}'.format(get_page_name(page)),
+                }
+            )
+        yield (
+            os.path.join(site_folder, get_page_name(page)),
+            'index.html',
+            index_context
+        )
+
+
+def get_job_hash(templates_hash: str, context: dict) -> str:
+    content = json.dumps(context, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(
+        (templates_hash + content).encode('utf-8')
+    ).hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, mode='r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, mode='w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_catalog(
+        books: list[dict],
+        site_folder: str = 'pages/',
+        templates_folder: str = 'templates/',
+        books_per_page: int = 20,
+        workers: int = 1,
+        full: bool = False
+) -> dict:
+    """Собирает статический каталог книг.
+
+    Для каждой страницы считается хэш шаблонов и данных, из которых
+    она рендерится. Рендерятся только страницы, у которых хэш
+    поменялся с прошлой сборки (или которых нет на диске), страницы
+    пропавших книг удаляются. Рендеринг идёт пачками в пуле процессов.
+
+    :param books: список словарей с информацией о книгах.
+    :param site_folder: папка сайта.
+    :param templates_folder: папка с шаблонами.
+    :param books_per_page: сколько книг на странице списка.
+    :param workers: сколько процессов рендерят страницы.
+    :param full: отрендерить все страницы заново.
+
+    :return: dict - сколько страниц отрендерено, пропущено и удалено.
+    """
+    os.makedirs(site_folder, exist_ok=True)
+    manifest_path = os.path.join(site_folder, MANIFEST_FILENAME)
+    old_manifest = {} if full else load_manifest(manifest_path)
+    templates_hash = get_templates_hash(templates_folder)
+
+    manifest = {}
+    jobs = []
+    for page_path, template_name, context in iter_page_jobs(
+            books,
+            site_folder,
+            books_per_page
+    ):
+        job_hash = get_job_hash(templates_hash, context)
+        manifest[page_path] = job_hash
+        if old_manifest.get(page_path) == job_hash \
+                and os.path.exists(page_path):
+            continue
+        jobs.append((page_path, template_name, context))
+
+    removed = 0
+    for page_path in old_manifest.keys() - manifest.keys():
+        if os.path.exists(page_path):
+            os.remove(page_path)
+            removed += 1
+
+    logger.info(
+        'Страниц в каталоге: %s, рендерим: %s',
+        len(manifest),
+        len(jobs)
+    )
+    cache_folder = os.path.join(site_folder, BYTECODE_CACHE_FOLDER)
+    batches = [
+        jobs[start:start + BATCH_SIZE]
+        for start in range(0, len(jobs), BATCH_SIZE)
+    ]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_environment,
+                initargs=(templates_folder, cache_folder)
+        ) as executor:
+            rendered = sum(executor.map(render_pages, batches))
+    else:
+        init_environment(templates_folder, cache_folder)
+        rendered = sum(map(render_pages, batches))
+
+    save_manifest(manifest_path, manifest)
+    return {
+        'rendered': rendered,
+        'skipped': len(manifest) - rendered,
+        'removed': removed,
+    }
+
+
+def load_books(args) -> list[dict]:
+    if args.metadata_db:
+        book_store = MetadataStore(args.metadata_db)
+        try:
+            return list(book_store.iter_books())
+        finally:
+            book_store.close()
+    with open(args.json_path, mode='r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def create_arg_parser():
+    description = 'Собираем статический каталог скаченных книг'
+    epilog = """
+    Повторная сборка рендерит только страницы, книги на которых поменялись
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=description,
+        epilog=epilog
+    )
+    arg_parser.add_argument('--json_path',
+                            default='downloaded_books_info.json',
+                            metavar='', type=str,
+                            help='''json с информацией о скаченных книгах.
+                            Значение по умолчанию downloaded_books_info.json '''
+                            )
+
+    arg_parser.add_argument('--metadata_db', default='', metavar='',
+                            type=str,
+                            help='''брать книги из базы SQLite вместо json.
+                            По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--site_folder', default='pages/', metavar='',
+                            type=str,
+                            help='''папка, куда сохраняется каталог.
+                            Значение по умолчанию pages/ '''
+                            )
+
+    arg_parser.add_argument('--templates_folder', default='templates/',
+                            metavar='', type=str,
+                            help='''папка с шаблонами jinja2.
+                            Значение по умолчанию templates/ '''
+                            )
+
+    arg_parser.add_argument('--books_per_page', default=20, metavar='',
+                            type=int,
+                            help='''сколько книг на странице списка.
+                            Значение по умолчанию 20 '''
+                            )
+
+    arg_parser.add_argument('--workers', default=os.cpu_count(), metavar='',
+                            type=int,
+                            help='''сколько процессов рендерят страницы.
+                            Значение по умолчанию - число ядер '''
+                            )
+
+    arg_parser.add_argument('--full', action='store_true',
+                            help='''Отрендерить все страницы заново.
+                            Значение по умолчанию False '''
+                            )
+
+    return arg_parser
+
+
+def main():
+    configure_logging()
+
+    parser = create_arg_parser()
+    args = parser.parse_args()
+    logger.debug('argparse %s', args)
+
+    if not args.metadata_db and not os.path.exists(args.json_path):
+        logger.critical('Нет файла с книгами %s', args.json_path)
+        raise KeyboardInterrupt
+
+    books = load_books(args)
+    result = build_catalog(
+        books,
+        args.site_folder,
+        args.templates_folder,
+        args.books_per_page,
+        args.workers,
+        args.full
+    )
+    logger.info(
+        'Каталог собран в %s: отрендерено страниц %s, без изменений %s, '
+        'удалено %s',
+        args.site_folder,
+        result['rendered'],
+        result['skipped'],
+        result['removed']
+    )
+
+
+if __name__ == '__main__':
+    try:
+        main()
+
+    except KeyboardInterrupt:
+        logger.info('Работа скрипта остановлена')
+
+    finally:
+        sys.exit()
@@ -0,0 +1,201 @@
+import re
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+
+import requests
+
+from dataclasses import dataclass
+
+from parser import SITE_ENCODING
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = (
+    (r'/b\d+/', 7 * 24 * 60 * 60),
+    (r'/l\d+/', 24 * 60 * 60),
+)
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """Страницы нет в кэше, а ходить на сайт нельзя (offline)."""
+
+
+@dataclass
+class CachedResponse:
+    """Страница сайта: url после редиректов и html.
+
+    html - строка (страница из кэша) или байты ответа сайта в кодировке
+    encoding, которые парсер декодирует сам.
+    """
+    url: str
+    html: str | bytes
+    encoding: str = SITE_ENCODING
+
+    @property
+    def text(self) -> str:
+        if isinstance(self.html, bytes):
+            return self.html.decode(self.encoding, errors='replace')
+        return self.html
+
+
+class ResponseCache:
+    """Кэш html страниц сайта в SQLite.
+
+    Страницы хранятся сжатыми (zlib). Срок жизни записи задаётся
+    регулярным выражением по url, при превышении max_size байт
+    удаляются давно не читанные страницы (LRU).
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_size: int = 512 * 1024 * 1024,
+            ttls=DEFAULT_TTLS,
+            offline: bool = False
+    ):
+        """
+        :param path: путь до файла базы SQLite.
+        :param max_size: сколько байт (сжатых) максимум занимает кэш.
+        :param ttls: пары (регулярное выражение по url, срок жизни в
+            секундах), подходящая первой пара задаёт срок, url которые
+            не подошли ни к одной паре не кэшируются.
+        :param offline: отдавать только из кэша, не ходить на сайт.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'url TEXT PRIMARY KEY, final_url TEXT, body BLOB, '
+            'size INTEGER, stored_at REAL, accessed_at REAL)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS pages_accessed_at '
+            'ON pages (accessed_at)'
+        )
+        self._connection.commit()
+        self.size = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM pages'
+        ).fetchone()[0]
+
+    def get_ttl(self, url: str) -> float | None:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def get(self, url: str) -> CachedResponse | None:
+        """Страница из кэша.
+
+        :param url: адрес страницы.
+
+        :return: CachedResponse - страница или None если её нет или
+            она устарела (в offline режиме устаревшие тоже отдаются).
+        """
+        ttl = self.get_ttl(url)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT final_url, body, stored_at FROM pages WHERE url = ?',
+                (url,)
+            ).fetchone()
+            if row is None or ttl is None:
+                self.misses += 1
+                return None
+            if not self.offline and time.time() - row[2] > ttl:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._connection.execute(
+                'UPDATE pages SET accessed_at = ? WHERE url = ?',
+                (time.time(), url)
+            )
+        final_url, body, _ = row
+        return CachedResponse(final_url, zlib.decompress(body).decode())
+
+    def put(self, url: str, final_url: str, text: str):
+        """Кладёт страницу в кэш.
+
+        :param url: адрес страницы.
+        :param final_url: адрес после редиректов.
+        :param text: html страницы.
+        """
+        if self.get_ttl(url) is None:
+            return
+        body = zlib.compress(text.encode())
+        now = time.time()
+        with self._lock:
+            old_row = self._connection.execute(
+                'SELECT size FROM pages WHERE url = ?',
+                (url,)
+            ).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                (url, final_url, body, len(body), now, now)
+            )
+            self.size += len(body) - (old_row[0] if old_row else 0)
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        while self.size > self.max_size:
+            rows = self._connection.execute(
+                'SELECT url, size FROM pages ORDER BY accessed_at LIMIT 100'
+            ).fetchall()
+            if not rows:
+                return
+            for url, size in rows:
+                self._connection.execute(
+                    'DELETE FROM pages WHERE url = ?',
+                    (url,)
+                )
+                self.size -= size
+                self.evicted += 1
+                if self.size <= self.max_size:
+                    return
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def report(self) -> str:
+        """Статистика попаданий в кэш.
+
+        :return: str - строка отчёта.
+        """
+        return (
+            'Кэш страниц: попаданий {}, промахов {}, вытеснено {}, '
+            'размер {} байт'.format(
+                self.hits,
+                self.misses,
+                self.evicted,
+                self.size
+            )
+        )
+
+
+cache = None
+
+
+def enable(path: str, **kwargs) -> ResponseCache:
+    """Включает кэш страниц.
+
+    :param path: путь до файла базы SQLite.
+    :param kwargs: остальные параметры ResponseCache.
+
+    :return: ResponseCache - кэш страниц.
+    """
+    global cache
+    cache = ResponseCache(path, **kwargs)
+    logger.info('Кэш страниц: %s', path)
+    return cache
@@ -0,0 +1,178 @@
+import time
+import asyncio
+import logging
+import weakref
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ('page', 'poster', 'txt')
+
+
+class DownloadScheduler:
+    """Приоритеты, лимиты и общая полоса для запросов разных классов.
+
+    Классы запросов по убыванию приоритета: page - страницы книг и
+    категорий, poster - обложки, txt - тексты книг. У каждого класса
+    свой лимит одновременных запросов (0 - без лимита), поэтому
+    большие тексты не занимают все соединения, а страницы и обложки
+    ждут свободного места только в своей очереди.
+
+    Полоса (байт в секунду, 0 - без ограничения) общая для всех
+    классов и раздаётся по приоритету: каждый класс ждёт только байты,
+    занятые своим и более приоритетными классами, а байты страниц и
+    обложек отодвигают очередь текстов. Пока идут страницы, тексты
+    докачиваются на том, что осталось от полосы.
+    """
+
+    def __init__(self, bandwidth: float = 0, limits: dict | None = None):
+        """
+        :param bandwidth: сколько байт в секунду качаем всего, 0 - без
+            ограничения.
+        :param limits: класс запроса -> сколько таких запросов идёт
+            одновременно, 0 или нет в словаре - без лимита.
+        """
+        self.bandwidth = bandwidth
+        self.limits = {
+            kind: (limits or {}).get(kind, 0) for kind in PRIORITY_CLASSES
+        }
+        self.bytes = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.waited = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self._semaphores = {
+            kind: threading.BoundedSemaphore(limit)
+            for kind, limit in self.limits.items()
+            if limit
+        }
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._free_at = [0.0] * len(PRIORITY_CLASSES)
+        self._lock = threading.Lock()
+
+    def slot(self, kind: str):
+        """Место под запрос класса kind, ждёт если лимит класса занят.
+
+        :param kind: класс запроса из PRIORITY_CLASSES.
+
+        :return: контекстный менеджер.
+        """
+        return self._semaphores.get(kind) or contextlib.nullcontext()
+
+    def async_slot(self, kind: str):
+        """То же что slot, для asyncio.
+
+        Семафоры asyncio привязаны к циклу событий, поэтому у каждого
+        цикла (каждого asyncio.run) они свои.
+        """
+        limit = self.limits[kind]
+        if not limit:
+            return contextlib.nullcontext()
+        semaphores = self._async_semaphores.setdefault(
+            asyncio.get_running_loop(),
+            {}
+        )
+        if kind not in semaphores:
+            semaphores[kind] = asyncio.Semaphore(limit)
+        return semaphores[kind]
+
+    def reserve(self, kind: str, size: int) -> float:
+        """Занимает полосу под size байт класса kind.
+
+        :param kind: класс запроса из PRIORITY_CLASSES.
+        :param size: сколько байт скачано.
+
+        :return: float - сколько секунд подождать перед следующими байтами.
+        """
+        priority = PRIORITY_CLASSES.index(kind)
+        with self._lock:
+            self.bytes[kind] += size
+            if not self.bandwidth:
+                return 0
+
+            now = time.monotonic()
+            duration = size / self.bandwidth
+            start = max(now, self._free_at[priority])
+            self._free_at[priority] = start + duration
+            for lower in range(priority + 1, len(self._free_at)):
+                self._free_at[lower] = max(
+                    max(self._free_at[lower], now) + duration,
+                    self._free_at[priority]
+                )
+            delay = start - now
+            self.waited[kind] += delay
+            return delay
+
+    def throttle(self, kind: str, size: int):
+        """Ждёт, пока полоса позволит скачать следующие байты."""
+        delay = self.reserve(kind, size)
+        if delay:
+            time.sleep(delay)
+
+    async def async_throttle(self, kind: str, size: int):
+        delay = self.reserve(kind, size)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def report(self) -> str:
+        """Отчёт сколько скачано и сколько ждали полосу по классам.
+
+        :return: str - строка отчёта.
+        """
+        return 'Планировщик: {}'.format(', '.join(
+            '{} {:.1f} МБ, ожидание {:.1f} сек.'.format(
+                kind,
+                self.bytes[kind] / 1024 / 1024,
+                self.waited[kind]
+            )
+            for kind in PRIORITY_CLASSES
+        ))
+
+
+scheduler = None
+
+_NULL_SLOT = contextlib.nullcontext()
+
+
+def enable(
+        bandwidth: float = 0,
+        limits: dict | None = None
+) -> DownloadScheduler:
+    """Включает планировщик скачиваний.
+
+    :param bandwidth: сколько байт в секунду качаем всего, 0 - без
+        ограничения.
+    :param limits: класс запроса -> сколько таких запросов идёт
+        одновременно.
+
+    :return: DownloadScheduler - планировщик.
+    """
+    global scheduler
+    scheduler = DownloadScheduler(bandwidth, limits)
+    logger.info(
+        'Планировщик скачиваний: полоса %s байт/сек., лимиты %s',
+        bandwidth or 'без ограничения',
+        scheduler.limits
+    )
+    return scheduler
+
+
+def slot(kind: str):
+    """Место под запрос, если планировщик выключен - пустой контекст."""
+    if scheduler is None:
+        return _NULL_SLOT
+    return scheduler.slot(kind)
+
+
+def async_slot(kind: str):
+    if scheduler is None:
+        return _NULL_SLOT
+    return scheduler.async_slot(kind)
+
+
+def throttle(kind: str, size: int):
+    if scheduler is not None:
+        scheduler.throttle(kind, size)
+
+
+async def async_throttle(kind: str, size: int):
+    if scheduler is not None:
+        await scheduler.async_throttle(kind, size)
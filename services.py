@@ -1,41 +1,87 @@
 import os
+import sys
 import json
-import time
+import textwrap
 import urllib
+import queue
+import atexit
 import logging
 import logging.config
+import logging.handlers
 import requests
 
 from urllib.parse import urljoin
+from typing import Iterator
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from pathvalidate import sanitize_filename
 
-from parser import parse_book_page
-from parser import parse_category_page
-from parser import get_number_of_pages_in_category
+import metrics
+import http_client
+import blob_store
+import incremental
+import response_cache
+import parse_pool
+import scheduler
+
+from storage import CHUNK_SIZE
+from response_cache import CachedResponse
+from response_cache import OfflineCacheMiss
+from storage import AtomicFileWriter
+from storage import is_compressed
+from storage import get_stored_filename
+from storage import get_shard_folder
 
-from jinja2 import (
-    Environment,
-    FileSystemLoader,
-    select_autoescape,
-    Template
-)
+from parser import parse_category_page
+from parser import parse_category_listing
+from parser import parse_category_ids
+from parser import SITE_ENCODING
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class Book:
+    """Информация о книге.
+
+    Поля лежат в __slots__, комментарии и жанры хранятся кортежами,
+    а автор и жанры интернируются, поэтому на больших обходах одинаковые
+    строки занимают память один раз.
+    """
     id: int
     title: str
     author: str
-    comments: list
-    genres: list
+    comments: tuple
+    genres: tuple
     download_link: str = ''
     poster_link: str = ''
     book_saved_path: str = ''
     poster_saved_path: str = ''
 
+    def __post_init__(self):
+        self.author = sys.intern(self.author)
+        self.comments = tuple(self.comments)
+        self.genres = tuple(sys.intern(genre) for genre in self.genres)
+
+    def __getitem__(self, name: str):
+        """Поле книги по имени, как у словаря из json с книгами."""
+        return getattr(self, name)
+
+    def to_json(self) -> str:
+        """Книга одной строкой json, без промежуточного словаря.
+
+        Строка такая же, как json.dumps словаря с полями книги.
+
+        :return: str - информация о книге в json.
+        """
+        return '{{{}}}'.format(', '.join(
+            '"{}": {}'.format(
+                name,
+                json.dumps(getattr(self, name), ensure_ascii=False)
+            )
+            for name in self.__slots__
+        ))
+
 
 def check_for_redirect(response: requests.Response):
     """Проверяет редирект на главную страницу.
@@ -44,8 +90,8 @@ def check_for_redirect(response: requests.Response):
 
     :param response: Ответ сайта tululu.org.
     """
-    logger.info('Проверка редиректа на главную страницу')
-    if response.url == 'https://tululu.org/':
+    logger.debug('Проверка редиректа на главную страницу')
+    if response.url == http_client.settings.base_url:
         raise requests.HTTPError
 
 
@@ -62,48 +108,136 @@ def fetch_book(
     :param skip_imgs: скачивать или не скачивать постеры к книге.
     :param skip_txt: скачивать или не скачивать книгу.
 
-    :return: tuple(id стартовой книги, id конечной книги).
+    :return: Book - информация по скаченной книге.
     """
     logger.info('фетчим книгу с id - %s', book_id)
-    while True:
-        try:
-            book = get_book(book_id)
-
-            request_params = {
-                'id': book.id
-            }
-            file_name = '{}_{}'.format(book_id, book.title)
-
-            logger.debug('file_name: %s', file_name)
-
-            logger.debug('skip_txt: %s', skip_txt)
-            if not skip_txt:
-                book_saved_path = download_txt(
-                    book.download_link,
-                    file_name,
-                    request_params,
-                    dest_folder
-                )
-                book.book_saved_path = book_saved_path
+    book = get_book(book_id)
+    download_book_files(book, dest_folder, skip_imgs, skip_txt)
+    logger.debug('Завершено')
+    return book
 
-            logger.debug('skip_imgs: %s', skip_imgs)
-            if not skip_imgs:
-                poster_saved_path = download_image(
-                    book.poster_link,
-                    dest_folder
-                )
-                book.poster_saved_path = poster_saved_path
 
-            logger.debug('book: %s', book)
-            logger.info('Завершено')
-            return book
+def download_book_files(
+        book: Book,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False
+) -> Book:
+    """Качает обложку и текст уже полученной книги.
+
+    Обложка качается первой: она маленькая и не должна ждать текст.
+    Пути до сохранённых файлов записываются в book.
 
-        except (requests.ConnectionError, requests.ConnectTimeout):
-            logger.error(
-                'Ошибка соединения, попытаюсь через 5 секунд повторно '
-                'скачать книгу'
-            )
-            time.sleep(5)
+    :param book: книга (Book) полученная с сайта.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+
+    :return: Book - та же книга с путями до файлов.
+    """
+    request_params = {
+        'id': book.id
+    }
+    file_name = '{}_{}'.format(book.id, book.title)
+
+    logger.debug('file_name: %s', file_name)
+
+    logger.debug('skip_imgs: %s', skip_imgs)
+    if not skip_imgs:
+        poster_saved_path = download_image(
+            book.poster_link,
+            dest_folder
+        )
+        book.poster_saved_path = poster_saved_path
+
+    logger.debug('skip_txt: %s', skip_txt)
+    if not skip_txt:
+        book_saved_path = download_txt(
+            book.download_link,
+            file_name,
+            request_params,
+            dest_folder
+        )
+        book.book_saved_path = book_saved_path
+
+    logger.debug(
+        'Книга %s: текст %s, обложка %s',
+        book.id,
+        book.book_saved_path,
+        book.poster_saved_path
+    )
+    return book
+
+
+def fetch_books(
+        book_ids,
+        dest_folder: str = './',
+        skip_imgs: bool = False,
+        skip_txt: bool = False,
+        workers: int = 1,
+        on_book=None,
+        download_workers: int | None = None
+) -> list[Book]:
+    """Параллельно качает книги и обложки с сайта tululu.org.
+
+    Страницы книг качаются и парсятся в одном пуле потоков, обложки и
+    тексты - в другом, поэтому большие тексты не задерживают страницы
+    следующих книг. book_ids может быть генератором: книги начинают
+    качаться сразу как появляются их id. Порядок результата совпадает
+    с порядком book_ids, книги которые не удалось скачать пропускаются.
+
+    :param book_ids: ID книг для скачивания.
+    :param dest_folder: корневая папка для сохранения результата.
+    :param skip_imgs: скачивать или не скачивать постеры к книге.
+    :param skip_txt: скачивать или не скачивать книгу.
+    :param workers: количество потоков для скачивания страниц книг.
+    :param on_book: функция, которую вызываем с каждой книгой сразу
+        после её скачивания.
+    :param download_workers: количество потоков для скачивания обложек
+        и текстов, по умолчанию как workers.
+
+    :return: list - список скаченных книг (Book).
+    """
+    download_workers = download_workers or workers
+    logger.info(
+        'Качаем книги в %s потоков, файлы в %s потоков',
+        workers,
+        download_workers
+    )
+
+    def download(book):
+        download_book_files(book, dest_folder, skip_imgs, skip_txt)
+        metrics.add('books')
+        if on_book is not None:
+            on_book(book)
+        return book
+
+    def fetch(book_id):
+        logger.info('фетчим книгу с id - %s', book_id)
+        book = get_book(book_id)
+        return download_executor.submit(download, book)
+
+    books = []
+    page_executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    download_executor = ThreadPoolExecutor(
+        max_workers=max(download_workers, 1)
+    )
+    with download_executor, page_executor:
+        futures = [
+            (book_id, page_executor.submit(fetch, book_id))
+            for book_id in book_ids
+        ]
+        for book_id, future in futures:
+            try:
+                books.append(future.result().result())
+            except requests.RequestException:
+                metrics.add('book_errors')
+                logger.error(
+                    'Не удалось скачать книгу или обложку. id - %s',
+                    book_id
+                )
+    logger.info('Скачано книг: %s', len(books))
+    return books
 
 
 def download_txt(
@@ -123,21 +257,28 @@ def download_txt(
 
     :return: str - Строку с указанием куда сохранили файл.
     """
-    logger.info('Скачиваем текстовую версию книги')
+    logger.debug('Скачиваем текстовую версию книги')
     logger.debug('url: %s', url)
 
-    response = requests.get(url, params)
-    logger.debug('response status code: %s', response.status_code)
-    response.raise_for_status()
-    check_for_redirect(response)
-
     folder = os.path.join(dest_folder, subfolder)
     logger.debug('Папка для сохранения: %s', folder)
 
-    filename = sanitize_filename('{}.txt'.format(filename))
+    filename = get_stored_filename(
+        sanitize_filename('{}.txt'.format(filename))
+    )
+    folder = get_shard_folder(folder, filename)
     logger.debug('Имя файла: %s', filename)
-    logger.info('информация получена. Попытка сохранить файл')
-    return save_file(folder, filename, response.content)
+
+    headers = incremental.conditional_headers(os.path.join(folder, filename))
+    with scheduler.slot('txt'):
+        response = http_client.get(url, params, headers=headers, stream=True)
+        with response:
+            logger.debug('response status code: %s', response.status_code)
+            response.raise_for_status()
+            check_for_redirect(response)
+
+            logger.debug('информация получена. Попытка сохранить файл')
+            return save_response(response, folder, filename)
 
 
 def download_image(url, dest_folder='', subfolder='images/') -> str:
@@ -149,22 +290,52 @@ def download_image(url, dest_folder='', subfolder='images/') -> str:
 
     :return: str - Строку с указанием куда сохранили файл.
     """
-    logger.info('Скачиваем обложку книги')
+    logger.debug('Скачиваем обложку книги')
     logger.debug('url: %s', url)
 
-    response = requests.get(url)
-    logger.debug('response status code: %s', response.status_code)
-    response.raise_for_status()
-    check_for_redirect(response)
-
     folder = os.path.join(dest_folder, subfolder)
     logger.debug('Папка для сохранения: %s', folder)
 
     filename = get_image_name_from_url(url)
+    folder = get_shard_folder(folder, filename)
     logger.debug('Имя файла: %s', filename)
-    logger.info('информация получена. Попытка сохранить файл')
 
-    return save_file(folder, filename, response.content)
+    poster_store = blob_store.store
+    if poster_store is not None:
+        digest = poster_store.lookup(url)
+        if digest is not None:
+            logger.debug('Обложка уже есть в хранилище')
+            return poster_store.materialize(digest, folder, filename)
+
+    headers = incremental.conditional_headers(os.path.join(folder, filename))
+    with scheduler.slot('poster'):
+        response = http_client.get(url, headers=headers, stream=True)
+        with response:
+            logger.debug('response status code: %s', response.status_code)
+            response.raise_for_status()
+            check_for_redirect(response)
+
+            logger.debug('информация получена. Попытка сохранить файл')
+            if poster_store is None:
+                return save_response(response, folder, filename, 'poster')
+
+            path_to_save = os.path.join(folder, filename)
+            if response.status_code == 304:
+                logger.debug('Файл %s не изменился', path_to_save)
+                incremental.mark_not_modified(path_to_save)
+                digest = poster_store.add_file(path_to_save, url)
+                return poster_store.materialize(digest, folder, filename)
+
+            with poster_store.open_writer() as writer:
+                for chunk in iter_response_chunks(response, 'poster'):
+                    writer.write(chunk)
+                if not writer.size:
+                    raise requests.HTTPError(
+                        'Пустой ответ на {}'.format(url),
+                        response=response
+                    )
+                digest = poster_store.add(writer, url)
+            return poster_store.materialize(digest, folder, filename)
 
 
 def get_book(book_id: int) -> Book:
@@ -174,26 +345,76 @@ def get_book(book_id: int) -> Book:
 
     :return: Book - информация по книге
     """
-    logger.info('Загружаем информацию с сайта о книге')
+    logger.debug('Загружаем информацию с сайта о книге')
 
-    url = '{}b{}/'.format('https://tululu.org/', book_id)
+    url = '{}b{}/'.format(http_client.settings.base_url, book_id)
     logger.debug('url: %s', url)
 
-    response = requests.get(url)
-    logger.debug('response status code: %s', response.status_code)
-    response.raise_for_status()
-    check_for_redirect(response)
-
-    book = parse_book_page(response.text)
+    page = get_page(url)
+    book = parse_pool.parse_book_page(page.html, page.encoding)
 
     book['id'] = book_id
-    book['poster_link'] = urljoin(response.url, book['poster_link'])
-    book['download_link'] = urljoin(response.url, '/txt.php')
+    book['poster_link'] = urljoin(page.url, book['poster_link'])
+    book['download_link'] = urljoin(page.url, '/txt.php')
 
-    logger.info('Завершено')
+    logger.debug('Завершено')
     return Book(**book)
 
 
+def get_page(url: str):
+    """Загружаем html страницу сайта, через кэш страниц если он включён.
+
+    :param url: адрес страницы.
+
+    Тело ответа отдаётся парсеру байтами с кодировкой из Content-Type
+    (если её там нет - кодировкой сайта), поэтому requests не угадывает
+    кодировку и не собирает из страницы строку.
+
+    :return: CachedResponse - url после редиректов и html страницы.
+    """
+    cache = response_cache.cache
+    if cache is not None:
+        cached_response = cache.get(url)
+        if cached_response is not None:
+            logger.debug('Страница %s взята из кэша', url)
+            check_for_redirect(cached_response)
+            return cached_response
+        if cache.offline:
+            raise OfflineCacheMiss(url)
+
+    with scheduler.slot('page'):
+        response = http_client.get(url)
+        logger.debug('response status code: %s', response.status_code)
+        response.raise_for_status()
+        try:
+            check_for_redirect(response)
+        except requests.HTTPError:
+            if cache is not None:
+                cache.put(url, response.url, '')
+            raise
+
+        metrics.add('bytes_downloaded', len(response.content))
+        scheduler.throttle('page', response.raw.tell())
+    page = CachedResponse(
+        response.url,
+        response.content,
+        get_page_encoding(response.headers.get('Content-Type'))
+    )
+    if cache is not None:
+        cache.put(url, page.url, page.text)
+    return page
+
+
+def get_page_encoding(content_type: str | None) -> str:
+    """Кодировка страницы: из Content-Type, иначе кодировка сайта.
+
+    :param content_type: значение заголовка Content-Type.
+
+    :return: str - кодировка.
+    """
+    return http_client.get_charset(content_type) or SITE_ENCODING
+
+
 def get_image_name_from_url(url: str) -> str:
     """Получаем имя картинки из url.
 
@@ -201,7 +422,7 @@ def get_image_name_from_url(url: str) -> str:
 
     :return: str - имя картинки
     """
-    logger.info('Получаем имя изображения из url: %s', url)
+    logger.debug('Получаем имя изображения из url: %s', url)
     split_result = urllib.parse.urlsplit(url)
     url_path = split_result.path
     return url_path.split('/')[-1]
@@ -216,28 +437,128 @@ def save_file(folder: str, filename: str, content: bytes) -> str:
 
     :return: str - путь куда сохранил
     """
-    logger.info(
+    logger.debug(
         'Сохраняем файл на диск в паку %s с именем %s',
         folder,
         filename
     )
+    with AtomicFileWriter(folder, filename) as writer:
+        writer.write(content)
+        path_to_save = writer.commit()
+    logger.debug('Сохранено')
+    return path_to_save
+
+
+def iter_response_chunks(response: requests.Response, kind: str):
+    """Тело ответа частями по CHUNK_SIZE, с ожиданием полосы планировщика.
+
+    Полоса тратится на байты, пришедшие из сети (response.raw.tell()):
+    при сжатии gzip это сжатые байты, а не распакованные.
+
+    :param response: ответ сайта с файлом (stream=True).
+    :param kind: класс запроса для планировщика скачиваний.
+
+    :return: Iterator - части тела ответа.
+    """
+    wire_bytes = response.raw.tell()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        metrics.add('bytes_downloaded', len(chunk))
+        scheduler.throttle(kind, response.raw.tell() - wire_bytes)
+        wire_bytes = response.raw.tell()
+        yield chunk
+
+
+def save_response(
+        response: requests.Response,
+        folder: str,
+        filename: str,
+        kind: str = 'txt'
+) -> str:
+    """Сохраняет скаченный файл, если он поменялся с прошлого скачивания.
+
+    Тело ответа пишется на диск частями по CHUNK_SIZE во временный файл,
+    который затем атомарно переименовывается. При ответе 304 или
+    совпадении содержимого с уже сохранённым файлом (инкрементальный
+    режим) файл не перезаписывается.
+    Если имя файла оканчивается на .gz, содержимое сжимается в gzip.
+
+    :param response: ответ сайта с файлом (stream=True).
+    :param folder: папка для сохранения.
+    :param filename: имя файла.
+    :param kind: класс запроса для планировщика скачиваний.
+
+    :return: str - путь до файла
+    """
     path_to_save = os.path.join(folder, filename)
-    os.makedirs(folder, exist_ok=True)
-    with open(path_to_save, mode='wb') as file:
-        file.write(content)
-    logger.info('Сохранено')
+    if response.status_code == 304:
+        logger.debug('Файл %s не изменился', path_to_save)
+        incremental.mark_not_modified(path_to_save)
+        return path_to_save
+
+    compress = is_compressed(filename)
+    with AtomicFileWriter(folder, filename, compress) as writer:
+        for chunk in iter_response_chunks(response, kind):
+            writer.write(chunk)
+
+        if incremental.is_unchanged(path_to_save, writer.size, writer.sha256):
+            logger.debug('Файл %s не изменился', path_to_save)
+            incremental.refresh(path_to_save, response.headers)
+            return path_to_save
+
+        writer.commit()
+        incremental.remember(
+            path_to_save,
+            response.headers,
+            writer.size,
+            writer.sha256,
+            writer.stored_size
+        )
     return path_to_save
 
 
+class BooksJsonWriter:
+    """Пишет книги в json файл по одной, в формате списка словарей."""
+
+    def __init__(self, path_to_save: str):
+        """
+        :param path_to_save: путь до json файла.
+        """
+        self.path = path_to_save
+        self._file = open(path_to_save, mode='w', encoding='utf-8')
+        self._separator = '[\n'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, book: dict):
+        book_json = json.dumps(book, indent=4, ensure_ascii=False)
+        self._file.write(self._separator)
+        self._file.write(textwrap.indent(book_json, '    '))
+        self._separator = ',\n'
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.write('[]' if self._separator == '[\n' else '\n]')
+        self._file.close()
+        self._file = None
+
+
 def save_books_as_json_file(
         filename: str,
-        books: list,
+        books,
         json_path: str = './'
 ) -> str:
     """Сохраняет информацию в json файл о скаченных книгах в категории.
 
+    Книги пишутся в файл по одной, поэтому books может быть генератором
+    и не обязан помещаться в память целиком.
+
     :param filename: имя файла.
-    :param books: список словарей с информацией о скаченных книгах.
+    :param books: список (или итератор) словарей с информацией о книгах.
     :param json_path: путь до каталога куда сохраняем файл с результатом.
 
     :return: str - путь куда сохранил
@@ -246,8 +567,9 @@ def save_books_as_json_file(
     path_to_save = os.path.join(json_path, filename)
     os.makedirs(json_path, exist_ok=True)
     logger.debug('path_to_save: %s', path_to_save)
-    with open(path_to_save, mode='w', encoding='utf-8') as file:
-        json.dump(books, file, indent=4, ensure_ascii=False)
+    with BooksJsonWriter(path_to_save) as writer:
+        for book in books:
+            writer.write(book)
 
     logger.info('Сохранено')
     return path_to_save
@@ -266,37 +588,57 @@ def get_book_ids_in_range_pages_in_category(
 
     :return: list - список id найденных книг в выбранном диапазоне
     """
+    book_ids = list(
+        iter_book_ids_in_range_pages_in_category(
+            category_id,
+            start_page,
+            end_page
+        )
+    )
+    logger.debug('book_ids: %s', book_ids)
+    logger.info('Айденты книг получены')
 
-    logger.info('Получаем айденты книг в категории %s', category_id)
+    return book_ids
+
+
+def iter_book_ids_in_range_pages_in_category(
+        category_id: int,
+        start_page: int = 1,
+        end_page: int = 2,
+        fetched_pages: dict | None = None
+) -> Iterator[int]:
+    """Отдаём id книг выбранной категории по мере загрузки её страниц.
+
+    Следующая страница категории запрашивается только когда
+    закончились id с предыдущей.
+
+    :param category_id: id книжной категории.
+    :param start_page: номер страницы категории откуда начинаем парсить.
+    :param end_page: номер страницы категории на которой заканчиваем парсить.
+    :param fetched_pages: уже скаченные страницы категории
+        {номер страницы: список id книг}, повторно не запрашиваются.
 
-    book_ids = []
+    :return: Iterator - id найденных книг в выбранном диапазоне
+    """
+    logger.info('Получаем айденты книг в категории %s', category_id)
+    fetched_pages = fetched_pages or {}
 
     for category_page in range(start_page, end_page):
-        while True:
+        book_ids_on_page = fetched_pages.get(category_page)
+        if book_ids_on_page is None:
             try:
                 book_ids_on_page = get_book_ids_from_category_page(
                     category_id,
                     category_page
                 )
-                book_ids.extend(book_ids_on_page)
-                break
-            except requests.HTTPError:
+            except requests.RequestException:
                 error_msg = 'Ошибка при парсинге страницы {} категории {}'.format(
                     category_page,
                     category_id
                 )
                 logger.error(error_msg)
-                break
-            except (requests.ConnectionError, requests.ConnectTimeout):
-                logger.error(
-                    'Ошибка соединения, попытаюсь через 5 секунд повторно '
-                    'получить данные со страницы '
-                )
-                time.sleep(5)
-    logger.debug('book_ids: %s', book_ids)
-    logger.info('Айденты книг получены')
-
-    return book_ids
+                book_ids_on_page = []
+        yield from book_ids_on_page
 
 
 def get_book_ids_from_category_page(
@@ -310,19 +652,22 @@ def get_book_ids_from_category_page(
 
     :return: list - список найденных id книг на странице категории.
     """
-    logger.info(
+    logger.debug(
         'Получаем информацию о id книгах на конкретной страницы категории.'
     )
 
-    url = f'https://tululu.org/l{category_id}/{category_page}/'
+    url = '{}l{}/{}/'.format(
+        http_client.settings.base_url,
+        category_id,
+        category_page
+    )
     logger.debug('url: %s', url)
-    response = requests.get(url)
-    response.raise_for_status()
-    check_for_redirect(response)
-    book_ids = parse_category_page(response.text)
+    page = get_page(url)
+    with metrics.timer('parse'):
+        book_ids = parse_category_page(page.html, page.encoding)
 
     logger.debug('book_ids: %s', book_ids)
-    logger.info('Получил айденты книг с конкретной страницы категории')
+    logger.debug('Получил айденты книг с конкретной страницы категории')
 
     return book_ids
 
@@ -334,19 +679,59 @@ def get_category_end_page(category_id: int) -> int:
 
     :return: int - сколько всего страниц в выбранной категории.
     """
-    logger.info(
-        'Получаем информацию о количестве страниц в выбранной категории %s',
+    category_end_page, _ = get_category_page(category_id)
+    return category_end_page
+
+
+def get_category_page(
+        category_id: int,
+        category_page: int = 1
+) -> tuple[int, list[int]]:
+    """Получаем количество страниц категории и id книг на её странице.
+
+    Страница скачивается и парсится один раз.
+
+    :param category_id: id книжной категории.
+    :param category_page: страница категории.
+
+    :return: tuple(сколько всего страниц в категории, список id книг
+        на странице категории).
+    """
+    logger.debug(
+        'Получаем страницу %s категории %s',
+        category_page,
         category_id
     )
 
-    url = f'https://tululu.org/l{category_id}/'
+    url = '{}l{}/{}/'.format(
+        http_client.settings.base_url,
+        category_id,
+        category_page
+    )
     logger.debug('url: %s', url)
 
-    response = requests.get(url)
-    response.raise_for_status()
-    check_for_redirect(response)
+    page = get_page(url)
+    with metrics.timer('parse'):
+        return parse_category_listing(page.html, page.encoding)
 
-    return get_number_of_pages_in_category(response.text)
+
+def get_category_ids() -> list[int]:
+    """Получаем id всех категорий (жанров) из меню главной страницы.
+
+    :return: list - id категорий по возрастанию.
+    """
+    url = http_client.settings.base_url
+    logger.debug('Ищем категории на странице %s', url)
+    response = http_client.get(url)
+    response.raise_for_status()
+    metrics.add('bytes_downloaded', len(response.content))
+    with metrics.timer('parse'):
+        category_ids = parse_category_ids(
+            response.content,
+            get_page_encoding(response.headers.get('Content-Type'))
+        )
+    logger.info('Найдено категорий: %s', len(category_ids))
+    return category_ids
 
 
 def configure_logging():
@@ -357,3 +742,37 @@ def configure_logging():
     except FileNotFoundError:
         logger.warning('Для настройки логирования нужен logging_config.json '
                        'в корне проекта')
+
+
+def start_log_queue() -> list[logging.handlers.QueueListener]:
+    """Переводим логирование на очередь.
+
+    Обработчики из logging_config.json переносятся в отдельный поток
+    (QueueListener), а потоки скачивания только кладут записи в очередь,
+    поэтому медленная запись логов на диск их не тормозит. Очередь
+    дописывается при выходе из программы.
+
+    :return: list - запущенные QueueListener.
+    """
+    loggers = [logging.getLogger()] + [
+        item for item in logging.Logger.manager.loggerDict.values()
+        if isinstance(item, logging.Logger)
+    ]
+    listeners = []
+    for logger_with_handlers in loggers:
+        handlers = logger_with_handlers.handlers
+        if not handlers:
+            continue
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            records,
+            *handlers,
+            respect_handler_level=True
+        )
+        logger_with_handlers.handlers = [
+            logging.handlers.QueueHandler(records)
+        ]
+        listener.start()
+        atexit.register(listener.stop)
+        listeners.append(listener)
+    return listeners
@@ -0,0 +1,323 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import tempfile
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+COMPRESSIONS = ('none', 'gzip')
+COMPRESSED_SUFFIX = '.gz'
+
+compression = 'none'
+
+LAYOUTS = ('flat', 'sharded')
+SHARD_SIZE = 1000
+
+layout = 'flat'
+shard_size = SHARD_SIZE
+
+_created_folders = set()
+_folders_lock = threading.Lock()
+
+
+def get_umask() -> int:
+    """Текущий umask процесса (узнать его можно только поменяв его)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# umask читаем один раз при импорте, пока не запущены другие потоки:
+# os.umask меняет его на время для всего процесса.
+FILE_MODE = 0o666 & ~get_umask()
+
+
+def set_compression(name: str):
+    """Выбираем как хранить тексты книг на диске.
+
+    none - как отдал сайт, gzip - сжатыми в файл с суффиксом .gz.
+
+    :param name: формат из COMPRESSIONS.
+    """
+    global compression
+    if name not in COMPRESSIONS:
+        raise ValueError('Неизвестный формат сжатия {}'.format(name))
+    compression = name
+    logger.debug('Сжатие текстов: %s', compression)
+
+
+def get_stored_filename(filename: str) -> str:
+    """Имя файла на диске с учётом выбранного сжатия.
+
+    :param filename: имя файла без сжатия.
+
+    :return: str - имя файла, под которым его сохраняем.
+    """
+    if compression == 'gzip':
+        return filename + COMPRESSED_SUFFIX
+    return filename
+
+
+def is_compressed(filename: str) -> bool:
+    return filename.endswith(COMPRESSED_SUFFIX)
+
+
+def open_stored(path: str, mode: str = 'rb', encoding: str | None = None):
+    """Открывает сохранённый файл, сжатые файлы (.gz) распаковываются.
+
+    Для чтения скаченных книг вместо open: путь берётся как есть
+    из book_saved_path.
+
+    :param path: путь до файла.
+    :param mode: 'rb' или 'rt'.
+    :param encoding: кодировка для 'rt'.
+
+    :return: файловый объект.
+    """
+    if is_compressed(path):
+        return gzip.open(path, mode, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+def set_layout(name: str, size: int = SHARD_SIZE):
+    """Выбираем как раскладывать книги и обложки по папкам.
+
+    flat - все файлы в одной папке (books/239_Алиби.txt), sharded - в
+    подпапках по id из начала имени файла: id // size
+    (при size=10 - books/23/239_Алиби.txt). Файлы без id в начале
+    имени (nopic.gif) остаются в общей папке.
+
+    :param name: раскладка из LAYOUTS.
+    :param size: сколько id попадает в одну подпапку.
+    """
+    global layout, shard_size
+    if name not in LAYOUTS:
+        raise ValueError('Неизвестная раскладка {}'.format(name))
+    if size < 1:
+        raise ValueError('Размер подпапки должен быть больше 0')
+    layout = name
+    shard_size = size
+    logger.debug('Раскладка файлов: %s по %s', layout, shard_size)
+
+
+def get_shard(filename: str, size: int | None = None) -> str | None:
+    """Подпапка файла в раскладке sharded.
+
+    :param filename: имя файла.
+    :param size: сколько id в одной подпапке, по умолчанию shard_size.
+
+    :return: str - имя подпапки или None, если в начале имени нет id.
+    """
+    match = re.match(r'\d+', filename)
+    if not match:
+        return None
+    return str(int(match.group()) // (size or shard_size))
+
+
+def get_shard_folder(folder: str, filename: str) -> str:
+    """Папка, куда кладём файл с учётом выбранной раскладки.
+
+    :param folder: общая папка (books/ или images/).
+    :param filename: имя файла.
+
+    :return: str - папка для сохранения.
+    """
+    if layout != 'sharded':
+        return folder
+    shard = get_shard(filename)
+    if shard is None:
+        return folder
+    return os.path.join(folder, shard)
+
+
+def resolve_saved_path(path: str) -> str:
+    """Путь до скаченного файла, который мог переехать при смене раскладки.
+
+    Для book_saved_path / poster_saved_path из старых json и базы:
+    если файла нет по сохранённому пути, ищем его в подпапке текущей
+    раскладки или в общей папке.
+
+    :param path: сохранённый путь.
+
+    :return: str - путь, по которому файл есть на диске (или path).
+    """
+    if not path or os.path.exists(path):
+        return path
+    folder, filename = os.path.split(path)
+    shard = get_shard(filename)
+    if shard is None:
+        return path
+    if os.path.basename(folder).isdigit():
+        folder = os.path.dirname(folder)
+    candidates = [
+        os.path.join(get_shard_folder(folder, filename), filename),
+        os.path.join(folder, filename),
+    ]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def ensure_folder(folder: str):
+    """Создаёт папку один раз за запуск, дальше берёт из кэша."""
+    if folder in _created_folders:
+        return
+    os.makedirs(folder, exist_ok=True)
+    with _folders_lock:
+        _created_folders.add(folder)
+
+
+def forget_folder(folder: str):
+    with _folders_lock:
+        _created_folders.discard(folder)
+
+
+def migrate_folder(folder: str, to_layout: str) -> dict:
+    """Перекладывает скаченные файлы папки в раскладку to_layout.
+
+    Файлы переносятся через os.replace, каждая подпапка создаётся
+    один раз, опустевшие подпапки удаляются.
+
+    :param folder: общая папка (books/ или images/).
+    :param to_layout: раскладка из LAYOUTS.
+
+    :return: dict - старый путь -> новый путь перенесённых файлов.
+    """
+    if to_layout not in LAYOUTS:
+        raise ValueError('Неизвестная раскладка {}'.format(to_layout))
+    moved = {}
+    if not os.path.isdir(folder):
+        return moved
+    paths = [
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(folder)
+        for filename in filenames
+        if not filename.endswith('.part')
+    ]
+    for path in paths:
+        filename = os.path.basename(path)
+        shard = get_shard(filename)
+        target_folder = folder
+        if to_layout == 'sharded' and shard is not None:
+            target_folder = os.path.join(folder, shard)
+        target_path = os.path.join(target_folder, filename)
+        if os.path.normpath(path) == os.path.normpath(target_path):
+            continue
+        ensure_folder(target_folder)
+        os.replace(path, target_path)
+        moved[path] = target_path
+    for root, _, _ in sorted(os.walk(folder), reverse=True):
+        if root != folder and not os.listdir(root):
+            os.rmdir(root)
+            forget_folder(root)
+    logger.info('Перенесено файлов из %s: %s', folder, len(moved))
+    return moved
+
+
+class AtomicFileWriter:
+    """Пишет файл по частям во временный файл и атомарно переименовывает.
+
+    Пока не вызван commit, на месте итогового файла остаётся прежняя
+    версия (или ничего), поэтому при падении недописанных файлов
+    не бывает. Размер и sha256 считаются по ходу записи (по исходному,
+    не сжатому содержимому), размер файла на диске (stored_size)
+    известен после commit.
+    """
+
+    def __init__(self, folder: str, filename: str, compress: bool = False):
+        """
+        :param folder: папка для сохранения (будет создана если её нет).
+        :param filename: имя файла.
+        :param compress: сжимать ли содержимое в gzip при записи.
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, filename)
+        self.compress = compress
+        self.size = 0
+        self.stored_size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+        self._stream = None
+        self._tmp_path = None
+
+    def __enter__(self):
+        ensure_folder(self.folder)
+        try:
+            fd, self._tmp_path = self._create_tmp_file()
+        except FileNotFoundError:
+            forget_folder(self.folder)
+            ensure_folder(self.folder)
+            fd, self._tmp_path = self._create_tmp_file()
+        self._file = os.fdopen(fd, mode='wb')
+        self._stream = self._file
+        if self.compress:
+            self._stream = gzip.GzipFile(
+                fileobj=self._file,
+                mode='wb',
+                compresslevel=6,
+                mtime=0
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._stream is not None and self._stream is not self._file:
+            self._stream.close()
+        self._stream = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path is not None:
+            os.remove(self._tmp_path)
+            self._tmp_path = None
+
+    def _create_tmp_file(self) -> tuple[int, str]:
+        """Временный файл рядом с итоговым.
+
+        mkstemp создаёт файл с правами 0600, а os.replace их сохраняет,
+        поэтому выставляем права как у open: FILE_MODE.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.folder,
+            prefix='.',
+            suffix='.part'
+        )
+        os.fchmod(fd, FILE_MODE)
+        return fd, tmp_path
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes):
+        with metrics.timer('disk_write'):
+            self._stream.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self, path: str | None = None) -> str:
+        """Переименовывает временный файл в итоговый.
+
+        :param path: куда переименовать, по умолчанию folder/filename.
+
+        :return: str - путь до сохранённого файла.
+        """
+        if path is not None:
+            self.path = path
+        if self._stream is not self._file:
+            self._stream.close()
+        self._stream = None
+        self._file.close()
+        self._file = None
+        self.stored_size = os.path.getsize(self._tmp_path)
+        os.replace(self._tmp_path, self.path)
+        self._tmp_path = None
+        logger.debug('Сохранено %s байт в %s', self.size, self.path)
+        return self.path
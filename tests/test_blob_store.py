@@ -0,0 +1,60 @@
+import io
+import hashlib
+
+import pytest
+import requests
+
+import blob_store
+import http_client
+import services
+
+POSTER_URL = 'https://tululu.org/shots/239.jpg'
+
+
+def make_response(status_code: int, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    response.url = POSTER_URL
+    return response
+
+
+@pytest.fixture
+def poster_store(tmp_path, monkeypatch):
+    store = blob_store.BlobStore(str(tmp_path / 'store'))
+    monkeypatch.setattr(blob_store, 'store', store)
+    return store
+
+
+def test_not_modified_poster_goes_to_store(tmp_path, poster_store,
+                                           monkeypatch):
+    poster = b'GIF89a poster'
+    images_folder = tmp_path / 'images'
+    images_folder.mkdir()
+    (images_folder / '239.jpg').write_bytes(poster)
+    monkeypatch.setattr(
+        http_client,
+        'get',
+        lambda *args, **kwargs: make_response(304, b'')
+    )
+
+    path = services.download_image(POSTER_URL, str(tmp_path))
+
+    with open(path, mode='rb') as file:
+        assert file.read() == poster
+    digest = hashlib.sha256(poster).hexdigest()
+    assert poster_store.lookup(POSTER_URL) == digest
+
+
+def test_empty_poster_is_not_stored(tmp_path, poster_store, monkeypatch):
+    monkeypatch.setattr(
+        http_client,
+        'get',
+        lambda *args, **kwargs: make_response(200, b'')
+    )
+
+    with pytest.raises(requests.HTTPError):
+        services.download_image(POSTER_URL, str(tmp_path))
+
+    assert poster_store.lookup(POSTER_URL) is None
+    assert not (tmp_path / 'images' / '239.jpg').exists()
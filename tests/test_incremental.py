@@ -0,0 +1,37 @@
+import io
+
+import pytest
+import requests
+
+import incremental
+import services
+
+
+def make_response(body: bytes, etag: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    response.headers['ETag'] = etag
+    return response
+
+
+@pytest.fixture
+def validator_store(tmp_path, monkeypatch):
+    store = incremental.ValidatorStore(str(tmp_path / 'validators.json'))
+    monkeypatch.setattr(incremental, 'store', store)
+    return store
+
+
+def test_same_content_with_new_etag_refreshes_validators(tmp_path,
+                                                         validator_store):
+    folder = str(tmp_path / 'books')
+    path = services.save_response(
+        make_response(b'text', '"v1"'),
+        folder,
+        'book.txt'
+    )
+
+    services.save_response(make_response(b'text', '"v2"'), folder, 'book.txt')
+
+    assert validator_store.writes_skipped == 1
+    assert incremental.conditional_headers(path) == {'If-None-Match': '"v2"'}
@@ -0,0 +1,15 @@
+import os
+import stat
+
+import storage
+
+
+def test_saved_file_gets_default_mode(tmp_path):
+    umask = os.umask(0)
+    os.umask(umask)
+
+    with storage.AtomicFileWriter(str(tmp_path), 'book.txt') as writer:
+        writer.write(b'text')
+        path = writer.commit()
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
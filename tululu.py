@@ -1,10 +1,24 @@
+import os
 import sys
-import requests
+import asyncio
 import argparse
 import logging
 
-from services import fetch_book
+import blob_store
+import http_client
+import incremental
+import response_cache
+import parse_pool
+import metadata_store
+import metrics
+import storage
+import scheduler
+
+from parser import set_backend
+from services import fetch_books
 from services import configure_logging
+from services import start_log_queue
+from async_services import async_fetch_books
 
 
 logger = logging.getLogger(__name__)
@@ -26,11 +40,163 @@ def create_arg_parser():
                             Значение по умолчанию 1 '''
                             )
 
+    arg_parser.add_argument('--engine', default='threads', metavar='',
+                            choices=['threads', 'async'],
+                            help='''как качаем: threads - пул потоков, 
+                            async - asyncio/aiohttp. 
+                            Значение по умолчанию threads '''
+                            )
+
+    arg_parser.add_argument('--parser', default='bs4', metavar='',
+                            choices=['bs4', 'lxml'],
+                            help='''чем парсим страницы: bs4 - BeautifulSoup, 
+                            lxml - быстрый парсер на lxml. 
+                            Значение по умолчанию bs4 '''
+                            )
+
+    arg_parser.add_argument('--parse_workers', default=0, metavar='',
+                            type=int,
+                            help='''сколько процессов парсят страницы книг, 
+                            0 - парсим в основном процессе. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--timeout', default=30, metavar='', type=float,
+                            help='''таймаут ожидания ответа сайта в секундах. 
+                            Значение по умолчанию 30 '''
+                            )
+
+    arg_parser.add_argument('--max_per_host', default=10, metavar='',
+                            type=int,
+                            help='''сколько соединений максимум держим к сайту. 
+                            Значение по умолчанию 10 '''
+                            )
+
+    arg_parser.add_argument('--rps', default=10, metavar='', type=float,
+                            help='''максимум запросов к сайту в секунду, 
+                            0 - без ограничения. При ответах 429/5xx скорость 
+                            снижается автоматически. 
+                            Значение по умолчанию 10 '''
+                            )
+
+    arg_parser.add_argument('--max_attempts', default=5, metavar='', type=int,
+                            help='''сколько раз пробуем запрос при ошибках 
+                            соединения и ответах 429/5xx. 
+                            Значение по умолчанию 5 '''
+                            )
+
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='''Не перекачивать и не перезаписывать 
+                            файлы, которые не поменялись с прошлого запуска. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--poster_cache', default='', metavar='',
+                            type=str,
+                            help='''папка общего хранилища обложек: одинаковые 
+                            обложки хранятся один раз, уже скаченные не 
+                            качаются повторно. По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--page_cache', default='', metavar='', type=str,
+                            help='''файл SQLite для кэша страниц книг и 
+                            категорий. По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--page_cache_size', default=512, metavar='',
+                            type=int,
+                            help='''сколько мегабайт максимум занимает кэш 
+                            страниц. Значение по умолчанию 512 '''
+                            )
+
+    arg_parser.add_argument('--offline', action='store_true',
+                            help='''Не ходить на сайт: страницы берутся только 
+                            из --page_cache, тексты и обложки не качаются. 
+                                    Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--metadata_db', default='', metavar='',
+                            type=str,
+                            help='''файл SQLite, куда добавляется информация 
+                            о скаченных книгах из всех запусков и категорий. 
+                            По умолчанию не используется '''
+                            )
+
+    arg_parser.add_argument('--metrics', default='', metavar='', type=str,
+                            help='''куда сохранить метрики запуска: файл .json 
+                            или текстовый формат Prometheus для остальных 
+                            имён. По умолчанию не сохраняются '''
+                            )
+
+    arg_parser.add_argument('--progress', default=0, metavar='', type=float,
+                            help='''раз в сколько секунд писать в лог сколько 
+                            скачано и с какой скоростью, 0 - не писать. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--fast_logging', action='store_true',
+                            help='''Писать логи из отдельного потока через 
+                            очередь, чтобы запись логов не тормозила 
+                            скачивание. Значение по умолчанию False '''
+                            )
+
+    arg_parser.add_argument('--compress', default='none', metavar='',
+                            choices=storage.COMPRESSIONS,
+                            help='''как хранить тексты книг: none - как есть, 
+                            gzip - сжатыми в файлы .txt.gz. 
+                            Значение по умолчанию none '''
+                            )
+
+    arg_parser.add_argument('--layout', default='flat', metavar='',
+                            choices=storage.LAYOUTS,
+                            help='''как раскладывать книги и обложки: 
+                            flat - в одну папку, sharded - по подпапкам 
+                            id // shard_size. Значение по умолчанию flat '''
+                            )
+
+    arg_parser.add_argument('--shard_size', default=storage.SHARD_SIZE,
+                            metavar='', type=int,
+                            help='''сколько id книг попадает в одну подпапку 
+                            при --layout sharded. 
+                            Значение по умолчанию 1000 '''
+                            )
+
+    arg_parser.add_argument('--bandwidth', default=0, metavar='', type=int,
+                            help='''сколько килобайт в секунду качаем всего, 
+                            0 - без ограничения. Полоса отдаётся сначала 
+                            страницам книг, потом обложкам, потом текстам. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--page_slots', default=0, metavar='', type=int,
+                            help='''сколько страниц книг и категорий качаем 
+                            одновременно, 0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--poster_slots', default=0, metavar='',
+                            type=int,
+                            help='''сколько обложек качаем одновременно, 
+                            0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
+    arg_parser.add_argument('--txt_slots', default=0, metavar='', type=int,
+                            help='''сколько текстов книг качаем одновременно, 
+                            0 - без отдельного лимита. 
+                            Значение по умолчанию 0 '''
+                            )
+
     arg_parser.add_argument('--end_id', default=11, metavar='', type=int,
                             help='''id книги до которой парсим. 
                             Значение по умолчанию 11 '''
                             )
 
+    arg_parser.add_argument('--workers', default=1, metavar='', type=int,
+                            help='''сколько книг качаем параллельно. 
+                            Значение по умолчанию 1 '''
+                            )
+
     return arg_parser
 
 
@@ -42,6 +208,21 @@ def main():
     parser = create_arg_parser()
     args = parser.parse_args()
     logger.debug('argparse %s', args)
+    if args.fast_logging:
+        start_log_queue()
+    storage.set_compression(args.compress)
+    storage.set_layout(args.layout, args.shard_size)
+
+    http_client.configure(
+        read_timeout=args.timeout,
+        max_per_host=args.max_per_host,
+        max_rps=args.rps,
+        max_attempts=args.max_attempts
+    )
+    set_backend(args.parser)
+    book_parse_pool = None
+    if args.parse_workers > 0:
+        book_parse_pool = parse_pool.enable(args.parse_workers)
 
     start_book_id = args.start_id
     end_book_id = args.end_id
@@ -52,15 +233,97 @@ def main():
         )
         raise KeyboardInterrupt
 
-    for book_id in range(start_book_id, end_book_id):
-        try:
-            fetch_book(book_id)
+    run_metrics = None
+    if args.metrics or args.progress:
+        run_metrics = metrics.enable()
+        if args.progress:
+            run_metrics.start_progress(args.progress)
 
-        except requests.HTTPError:
-            logger.error(
-                'Не удалось скачать книгу или обложку. id - %s',
-                book_id
+    validator_store = None
+    if args.incremental:
+        validator_store = incremental.enable(
+            os.path.join('./', 'downloaded_files_validators.json')
+        )
+
+    page_cache = None
+    if args.page_cache or args.offline:
+        page_cache = response_cache.enable(
+            args.page_cache or 'page_cache.sqlite3',
+            max_size=args.page_cache_size * 1024 * 1024,
+            offline=args.offline
+        )
+
+    poster_store = None
+    if args.poster_cache:
+        poster_store = blob_store.enable(args.poster_cache)
+
+    book_store = None
+    if args.metadata_db:
+        book_store = metadata_store.enable(args.metadata_db)
+
+    download_scheduler = None
+    if args.bandwidth or args.page_slots or args.poster_slots \
+            or args.txt_slots:
+        download_scheduler = scheduler.enable(
+            args.bandwidth * 1024,
+            {
+                'page': args.page_slots,
+                'poster': args.poster_slots,
+                'txt': args.txt_slots,
+            }
+        )
+
+    def store_book(book):
+        if book_store is not None:
+            book.download_link = f'{book.download_link}?id={book.id}'
+            book_store.upsert(book)
+
+    book_ids = range(start_book_id, end_book_id)
+    if args.engine == 'async':
+        asyncio.run(
+            async_fetch_books(
+                book_ids,
+                skip_imgs=args.offline,
+                skip_txt=args.offline,
+                concurrency=args.workers,
+                on_book=store_book
             )
+        )
+    else:
+        fetch_books(
+            book_ids,
+            skip_imgs=args.offline,
+            skip_txt=args.offline,
+            workers=args.workers,
+            on_book=store_book
+        )
+
+    if validator_store is not None:
+        logger.info(validator_store.report())
+
+    if poster_store is not None:
+        logger.info(poster_store.report())
+
+    if page_cache is not None:
+        logger.info(page_cache.report())
+        page_cache.close()
+
+    if book_store is not None:
+        logger.info(book_store.report())
+        book_store.close()
+
+    if book_parse_pool is not None:
+        book_parse_pool.shutdown()
+        logger.info(book_parse_pool.report())
+
+    if download_scheduler is not None:
+        logger.info(download_scheduler.report())
+
+    if run_metrics is not None:
+        run_metrics.stop_progress()
+        logger.info(run_metrics.summary())
+        if args.metrics:
+            run_metrics.save(args.metrics)
 
 
 if __name__ == '__main__':
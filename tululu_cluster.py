@@ -0,0 +1,337 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+
+import requests
+
+import storage
+import http_client
+import work_queue
+
+from parser import set_backend
+from services import fetch_books
+from services import configure_logging
+from services import get_category_page
+from services import save_books_as_json_file
+from services import iter_book_ids_in_range_pages_in_category
+from work_queue import WorkQueue
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_arg_parser():
+    description = 'Качаем книги для деда на нескольких машинах =)'
+    epilog = """
+    coordinator делит книги на аренды в общей очереди, ждёт пока воркеры
+    всё скачают и собирает downloaded_books_info.json.
+    worker забирает аренды из очереди и качает книги.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=description,
+        epilog=epilog
+    )
+    arg_parser.add_argument('--queue', default='crawl_queue.sqlite3',
+                            metavar='', type=str,
+                            help='''файл SQLite с общей очередью, должен быть
+                            доступен всем машинам.
+                            Значение по умолчанию crawl_queue.sqlite3 '''
+                            )
+
+    arg_parser.add_argument('--lease_timeout', default=300, metavar='',
+                            type=float,
+                            help='''через сколько секунд без новых книг
+                            аренда отдаётся другому воркеру.
+                            Значение по умолчанию 300 '''
+                            )
+
+    arg_parser.add_argument('--poll', default=5, metavar='', type=float,
+                            help='''как часто в секундах проверяем очередь.
+                            Значение по умолчанию 5 '''
+                            )
+
+    subparsers = arg_parser.add_subparsers(dest='role', required=True)
+
+    coordinator_parser = subparsers.add_parser(
+        'coordinator',
+        help='заполняет очередь и собирает результат'
+    )
+    coordinator_parser.add_argument('--start_id', default=1, metavar='',
+                                    type=int,
+                                    help='''id книги с которой начнем парсить.
+                                    Значение по умолчанию 1 '''
+                                    )
+
+    coordinator_parser.add_argument('--end_id', default=11, metavar='',
+                                    type=int,
+                                    help='''id книги до которой парсим.
+                                    Значение по умолчанию 11 '''
+                                    )
+
+    coordinator_parser.add_argument('--category_id', default=None,
+                                    metavar='', type=int,
+                                    help='''если указана, качаем книги
+                                    категории по страницам, а не по id '''
+                                    )
+
+    coordinator_parser.add_argument('--start_page', default=1, metavar='',
+                                    type=int,
+                                    help='''страница категории с которой
+                                    начинаем. Значение по умолчанию 1 '''
+                                    )
+
+    coordinator_parser.add_argument('--end_page', default=0, metavar='',
+                                    type=int,
+                                    help='''страница категории на которой
+                                    заканчиваем, 0 - последняя страница.
+                                    Значение по умолчанию 0 '''
+                                    )
+
+    coordinator_parser.add_argument('--lease_size', default=50, metavar='',
+                                    type=int,
+                                    help='''сколько id книг (или страниц
+                                    категории) в одной аренде.
+                                    Значение по умолчанию 50 '''
+                                    )
+
+    coordinator_parser.add_argument('--json_path', default='./', metavar='',
+                                    type=str,
+                                    help='''путь до каталога с результатом
+                                    downloaded_books_info.json.
+                                    Значение по умолчанию ./ '''
+                                    )
+
+    worker_parser = subparsers.add_parser(
+        'worker',
+        help='качает книги из очереди'
+    )
+    worker_parser.add_argument('--dest_folder', default='./', metavar='',
+                               type=str,
+                               help='''путь до каталога с результатами
+                               парсинга. Значение по умолчанию ./ '''
+                               )
+
+    worker_parser.add_argument('--skip_imgs', action='store_true',
+                               help='''Не скачивать картинки.
+                               Значение по умолчанию False '''
+                               )
+
+    worker_parser.add_argument('--skip_txt', action='store_true',
+                               help='''Не скачивать книги.
+                               Значение по умолчанию False '''
+                               )
+
+    worker_parser.add_argument('--workers', default=1, metavar='', type=int,
+                               help='''сколько книг качаем параллельно.
+                               Значение по умолчанию 1 '''
+                               )
+
+    worker_parser.add_argument('--parser', default='bs4', metavar='',
+                               choices=['bs4', 'lxml'],
+                               help='''чем парсим страницы: bs4 -
+                               BeautifulSoup, lxml - быстрый парсер на lxml.
+                               Значение по умолчанию bs4 '''
+                               )
+
+    worker_parser.add_argument('--rps', default=10, metavar='', type=float,
+                               help='''максимум запросов к сайту в секунду
+                               с этой машины, 0 - без ограничения.
+                               Значение по умолчанию 10 '''
+                               )
+
+    worker_parser.add_argument('--layout', default='flat', metavar='',
+                               choices=storage.LAYOUTS,
+                               help='''как раскладывать книги и обложки:
+                               flat - в одну папку, sharded - по подпапкам
+                               id // shard_size. У всех воркеров должна
+                               быть одна раскладка.
+                               Значение по умолчанию flat '''
+                               )
+
+    worker_parser.add_argument('--shard_size', default=storage.SHARD_SIZE,
+                               metavar='', type=int,
+                               help='''сколько id книг в одной подпапке.
+                               Значение по умолчанию 1000 '''
+                               )
+
+    worker_parser.add_argument('--worker_name', default='', metavar='',
+                               type=str,
+                               help='''имя воркера в очереди.
+                               По умолчанию имя машины и pid '''
+                               )
+
+    return arg_parser
+
+
+def run_coordinator(queue: WorkQueue, args):
+    """Заполняет очередь, ждёт пока воркеры всё скачают, сохраняет json.
+
+    Если очередь уже заполнена (перезапуск координатора), она не
+    заполняется заново.
+
+    :param queue: общая очередь.
+    :param args: аргументы командной строки.
+    """
+    if queue.has_leases():
+        logger.info('Очередь %s уже заполнена, ждём воркеров', queue.path)
+    elif args.category_id is None:
+        if args.start_id > args.end_id:
+            logger.critical(
+                'id стартовой книги не может быть больше id конечной книги'
+            )
+            raise KeyboardInterrupt
+        leases_count = queue.add_leases(
+            args.start_id,
+            args.end_id,
+            args.lease_size
+        )
+        logger.info('В очередь добавлено аренд: %s', leases_count)
+    else:
+        category_end_page_on_site, _ = get_category_page(args.category_id)
+        end_page = args.end_page or category_end_page_on_site
+        if end_page > category_end_page_on_site:
+            logger.critical(
+                'Страниц у выбранной категории %s \n'
+                'Поменяйте диапазон для скачивания',
+                category_end_page_on_site,
+            )
+            raise KeyboardInterrupt
+        leases_count = queue.add_leases(
+            args.start_page,
+            end_page + 1,
+            args.lease_size,
+            args.category_id
+        )
+        logger.info('В очередь добавлено аренд: %s', leases_count)
+
+    while not queue.is_finished():
+        logger.info('Аренды в очереди: %s', queue.get_progress())
+        time.sleep(args.poll)
+
+    progress = queue.get_progress()
+    if progress.get(work_queue.FAILED):
+        logger.warning(
+            'Не удалось скачать аренд: %s',
+            progress[work_queue.FAILED]
+        )
+    save_books_as_json_file(
+        'downloaded_books_info.json',
+        queue.iter_books(),
+        args.json_path
+    )
+
+
+def process_lease(queue: WorkQueue, lease: work_queue.Lease, worker: str,
+                  args):
+    """Качает книги одной аренды и складывает их в очередь.
+
+    Каждая скаченная книга продлевает аренду.
+
+    :param queue: общая очередь.
+    :param lease: аренда.
+    :param worker: имя воркера.
+    :param args: аргументы командной строки.
+    """
+    logger.info('Аренда %s: %s - %s', lease.lease_id, lease.start, lease.end)
+    if lease.category_id is None:
+        book_ids = range(lease.start, lease.end)
+    else:
+        book_ids = iter_book_ids_in_range_pages_in_category(
+            lease.category_id,
+            lease.start,
+            lease.end
+        )
+    positions = {}
+
+    def get_numbered_book_ids():
+        for seq, book_id in enumerate(book_ids):
+            positions[book_id] = seq
+            yield book_id
+
+    def report_book(book):
+        book.download_link = f'{book.download_link}?id={book.id}'
+        queue.add_book(lease, positions[book.id], book)
+        if not queue.renew(lease, worker):
+            logger.warning(
+                'Аренда %s просрочена и отдана другому воркеру',
+                lease.lease_id
+            )
+
+    fetch_books(
+        get_numbered_book_ids(),
+        args.dest_folder,
+        args.skip_imgs,
+        args.skip_txt,
+        args.workers,
+        report_book
+    )
+    if not queue.complete(lease, worker):
+        logger.warning(
+            'Аренда %s просрочена и отдана другому воркеру, '
+            'её закончит новый воркер',
+            lease.lease_id
+        )
+
+
+def run_worker(queue: WorkQueue, args):
+    """Забирает аренды из очереди пока они не закончатся.
+
+    Пока координатор не заполнил очередь, воркер ждёт.
+
+    :param queue: общая очередь.
+    :param args: аргументы командной строки.
+    """
+    worker = args.worker_name or '{}-{}'.format(
+        socket.gethostname(),
+        os.getpid()
+    )
+    http_client.configure(max_rps=args.rps)
+    set_backend(args.parser)
+    storage.set_layout(args.layout, args.shard_size)
+    logger.info('Воркер %s', worker)
+
+    while True:
+        lease = queue.claim(worker)
+        if lease is not None:
+            process_lease(queue, lease, worker, args)
+            continue
+        if queue.has_leases() and queue.is_finished():
+            break
+        time.sleep(args.poll)
+    logger.info('Очередь пуста, воркер %s закончил', worker)
+
+
+def main():
+    configure_logging()
+
+    logger.info('Старт парсера')
+
+    parser = create_arg_parser()
+    args = parser.parse_args()
+    logger.debug('argparse %s', args)
+
+    queue = WorkQueue(args.queue, lease_timeout=args.lease_timeout)
+    try:
+        if args.role == 'coordinator':
+            run_coordinator(queue, args)
+        else:
+            run_worker(queue, args)
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+
+    except requests.RequestException as error:
+        logger.critical('Ошибка соединения с сайтом: %s', error)
+
+    except KeyboardInterrupt:
+        logger.info('Работа скрипта остановлена')
+
+    finally:
+        sys.exit()
@@ -0,0 +1,213 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@dataclass
+class Lease:
+    lease_id: int
+    start: int
+    end: int
+    category_id: int | None = None
+
+
+class WorkQueue:
+    """Общая очередь работы для нескольких машин в файле SQLite.
+
+    Координатор делит диапазон id книг (или страниц категории) на
+    аренды (leases), воркеры забирают аренды, качают книги и кладут
+    результаты в ту же базу. Аренда, которую воркер не продлил за
+    lease_timeout секунд (воркер упал или завис), достаётся другому
+    воркеру. Аренда, которую забирали max_claims раз, считается
+    проваленной.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            lease_timeout: float = 300,
+            max_claims: int = 3
+    ):
+        """
+        :param path: путь до файла базы SQLite (общий для всех машин).
+        :param lease_timeout: через сколько секунд без продления аренда
+            отдаётся другому воркеру.
+        :param max_claims: сколько раз аренду можно забрать.
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_claims = max_claims
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._connection.executescript(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'lease_id INTEGER PRIMARY KEY, category_id INTEGER, '
+            'start INTEGER, end INTEGER, state TEXT, worker TEXT, '
+            'expires_at REAL, claims INTEGER DEFAULT 0);'
+            'CREATE TABLE IF NOT EXISTS books ('
+            'book_id INTEGER PRIMARY KEY, lease_id INTEGER, seq INTEGER, '
+            'data TEXT);'
+            'CREATE INDEX IF NOT EXISTS books_order ON books (lease_id, seq);'
+        )
+
+    def _execute(self, query: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection.execute(query, params)
+
+    def has_leases(self) -> bool:
+        row = self._execute('SELECT 1 FROM leases LIMIT 1').fetchone()
+        return row is not None
+
+    def add_leases(
+            self,
+            start: int,
+            end: int,
+            lease_size: int,
+            category_id: int | None = None
+    ) -> int:
+        """Делит диапазон [start, end) на аренды по lease_size.
+
+        :param start: первый id книги (или страница категории).
+        :param end: id (или страница) на котором заканчиваем, не входит.
+        :param lease_size: сколько id (или страниц) в одной аренде.
+        :param category_id: id категории, если делим страницы категории.
+
+        :return: int - сколько аренд добавлено.
+        """
+        leases = [
+            (category_id, lease_start, min(lease_start + lease_size, end))
+            for lease_start in range(start, end, max(lease_size, 1))
+        ]
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._connection.executemany(
+                'INSERT INTO leases (category_id, start, end, state) '
+                'VALUES (?, ?, ?, \'{}\')'.format(PENDING),
+                leases
+            )
+            self._connection.execute('COMMIT')
+        return len(leases)
+
+    def claim(self, worker: str) -> Lease | None:
+        """Забирает свободную или просроченную аренду.
+
+        :param worker: имя воркера.
+
+        :return: Lease - аренда или None если свободных нет.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                self._connection.execute(
+                    'UPDATE leases SET state = ? '
+                    'WHERE state = ? AND expires_at < ? AND claims >= ?',
+                    (FAILED, LEASED, now, self.max_claims)
+                )
+                row = self._connection.execute(
+                    'SELECT lease_id, start, end, category_id FROM leases '
+                    'WHERE state = ? OR (state = ? AND expires_at < ?) '
+                    'ORDER BY lease_id LIMIT 1',
+                    (PENDING, LEASED, now)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        'UPDATE leases SET state = ?, worker = ?, '
+                        'expires_at = ?, claims = claims + 1 '
+                        'WHERE lease_id = ?',
+                        (LEASED, worker, now + self.lease_timeout, row[0])
+                    )
+                self._connection.execute('COMMIT')
+            except sqlite3.Error:
+                self._connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return Lease(*row)
+
+    def renew(self, lease: Lease, worker: str) -> bool:
+        """Продлевает аренду.
+
+        :return: bool - False если аренду уже отдали другому воркеру.
+        """
+        cursor = self._execute(
+            'UPDATE leases SET expires_at = ? '
+            'WHERE lease_id = ? AND worker = ? AND state = ?',
+            (time.time() + self.lease_timeout, lease.lease_id, worker, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def add_book(self, lease: Lease, seq: int, book):
+        """Сохраняет скаченную книгу.
+
+        :param lease: аренда, в которой скачали книгу.
+        :param seq: номер книги внутри аренды (для порядка в json).
+        :param book: скаченная книга (services.Book).
+        """
+        self._execute(
+            'INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?)',
+            (book.id, lease.lease_id, seq, book.to_json())
+        )
+
+    def complete(self, lease: Lease, worker: str) -> bool:
+        """Отмечает аренду выполненной.
+
+        :return: bool - False если аренду уже отдали другому воркеру.
+        """
+        cursor = self._execute(
+            'UPDATE leases SET state = ? '
+            'WHERE lease_id = ? AND worker = ? AND state = ?',
+            (DONE, lease.lease_id, worker, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def get_progress(self) -> dict:
+        """Сколько аренд в каждом состоянии.
+
+        :return: dict - {состояние: количество}.
+        """
+        rows = self._execute(
+            'SELECT state, COUNT(*) FROM leases GROUP BY state'
+        ).fetchall()
+        return dict(rows)
+
+    def is_finished(self) -> bool:
+        progress = self.get_progress()
+        return not progress.get(PENDING) and not progress.get(LEASED)
+
+    def iter_books(self):
+        """Скаченные книги в порядке аренд.
+
+        Книги читаются из базы по одной через отдельное соединение.
+
+        :return: генератор словарей с информацией о книгах.
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            rows = connection.execute(
+                'SELECT data FROM books ORDER BY lease_id, seq'
+            )
+            for (data,) in rows:
+                yield json.loads(data)
+        finally:
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()